@@ -0,0 +1,319 @@
+# offline benchmarks for each stage of the pipeline, run against the fixture server and
+# synthetic histories so the numbers don't depend on the network or on what's posted today.
+# every case runs in its own process so its peak memory can be measured on its own.
+#
+#   python -m benchmarks.bench                      api scraping, filtering and dedup
+#   python -m benchmarks.bench --selenium           also the selenium workday and garmin scrapers
+#   python -m benchmarks.bench --quick              smaller sizes
+#   python -m benchmarks.bench --output new.json --compare old.json
+#
+# for each case it reports throughput (items per second), latency percentiles of the unit of
+# work (a request, a job, a dedup batch) and the peak rss of the process
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from functools import partial
+
+from benchmarks.fixture_server import start_fixture_server
+
+SEED = 0
+
+
+def _percentiles(samples):
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None}
+    samples = sorted(samples)
+    if len(samples) == 1:
+        return {"p50": samples[0], "p95": samples[0], "p99": samples[0]}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def _peak_rss_mb():
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# records how long every call to module.name takes
+def _time_calls(module, name, samples):
+    original = getattr(module, name)
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+
+    setattr(module, name, timed)
+
+
+def bench_workday_api(url, postings):
+    from company_scrapers import workday_api
+
+    samples = []
+    _time_calls(workday_api, "_request_json", samples)
+    start = time.perf_counter()
+    jobs = workday_api.scrape_workday_api(url, tenant="bench")
+    workday_api.resolve_locations_api([job for job in jobs if "Locations" in job["location"]])
+    seconds = time.perf_counter() - start
+    return {"items": len(jobs), "seconds": seconds, "latency": samples, "unit": "request"}
+
+
+def bench_workday_selenium(url, postings):
+    from company_scrapers import workday_scraper
+    from company_scrapers.driver_pool import close_pool
+
+    samples = []
+    _time_calls(workday_scraper, "read_locations", samples)
+    start = time.perf_counter()
+    jobs = list(workday_scraper.scrape_workday_selenium(url))
+    workday_scraper.resolve_locations_parallel([job for job in jobs if "Locations" in job["location"]])
+    seconds = time.perf_counter() - start
+    close_pool()
+    return {"items": len(jobs), "seconds": seconds, "latency": samples, "unit": "detail page"}
+
+
+def bench_garmin(url, postings):
+    from company_scrapers.garmin_scraper import scrape_garmin
+    from company_scrapers.driver_pool import close_pool
+
+    start = time.perf_counter()
+    jobs = list(scrape_garmin(url))
+    seconds = time.perf_counter() - start
+    close_pool()
+    return {"items": len(jobs), "seconds": seconds, "latency": [seconds], "unit": "scrape"}
+
+
+def bench_filter(num_jobs, num_keywords):
+    from benchmarks.bench_matcher import make_config, make_jobs
+    from matcher import JobMatcher
+
+    config = make_config(num_keywords)
+    jobs = make_jobs(num_jobs, SEED)
+    samples = []
+    start = time.perf_counter()
+    matcher = JobMatcher(config)
+    for job in jobs:
+        job_start = time.perf_counter()
+        matcher.match_location(job["location"]) is not None and matcher.match_title(job["title"])
+        samples.append(time.perf_counter() - job_start)
+    seconds = time.perf_counter() - start
+    return {"items": num_jobs, "seconds": seconds, "latency": samples, "unit": "job"}
+
+
+# a sent_jobs.csv with history_size rows spread over companies, like years of runs would leave
+def write_history(path, history_size, companies=70):
+    rng = random.Random(SEED)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["company", "title", "link", "location", "job_id", "added_date"])
+        for i in range(history_size):
+            company = f"Company {i % companies}"
+            writer.writerow([
+                company,
+                rng.choice(["Software Engineer", "Backend Engineer", "Full Stack Developer"]),
+                f"https://company{i % companies}.wd1.myworkdayjobs.com/External/job/R{i:07d}",
+                json.dumps([rng.choice(["Santa Clara, CA", "Remote, US", "New York, NY"])]),
+                f"R{i:07d}",
+                "2025-01-01 00:00:00",
+            ])
+
+
+def _dir_mb(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / (1024 * 1024)
+
+
+# with archived=True the history is moved to the parquet archive first, so every lookup misses
+# jobs.db and is answered by the archive. with resent=False none of the links were sent before,
+# like most of a run's postings
+def bench_dedup(history_size, batches=200, batch_size=50, archived=False, resent=True):
+    from job_store import JobStore
+
+    rng = random.Random(SEED)
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "sent_jobs.csv")
+        write_history(csv_path, history_size)
+        store = JobStore(os.path.join(tmp, "jobs.db"))
+        migrate_start = time.perf_counter()
+        store.migrate(csv_path, os.path.join(tmp, "missing.json"))
+        migrate_seconds = time.perf_counter() - migrate_start
+        extra = {"migrate_seconds": migrate_seconds}
+        if archived:
+            from history_archive import HistoryArchive
+
+            store.archive = HistoryArchive(os.path.join(tmp, "history"))
+            archive_start = time.perf_counter()
+            store.archive_sent(-1)
+            extra["archive_seconds"] = time.perf_counter() - archive_start
+            extra["archive_mb"] = _dir_mb(store.archive.path)
+        store.conn.execute("VACUUM")
+        extra["db_mb"] = os.path.getsize(store.path) / (1024 * 1024)
+
+        # half of every batch was sent before (unless resent is off), half is new
+        samples = []
+        start = time.perf_counter()
+        for _ in range(batches):
+            company_index = rng.randrange(70)
+            jobs = []
+            for j in range(batch_size):
+                i = rng.randrange(max(history_size, 1)) if resent and j % 2 == 0 else history_size + rng.randrange(10 ** 6)
+                jobs.append({
+                    "title": "Software Engineer",
+                    "link": f"https://company{company_index}.wd1.myworkdayjobs.com/External/job/R{i:07d}",
+                })
+            batch_start = time.perf_counter()
+            store.filter_unsent(jobs, f"Company {company_index}")
+            samples.append(time.perf_counter() - batch_start)
+        seconds = time.perf_counter() - start
+        store.close()
+    return {"items": batches * batch_size, "seconds": seconds, "latency": samples, "unit": "batch", "extra": extra}
+
+
+def _build_archive(tmp, history_size):
+    from job_store import JobStore
+    from history_archive import HistoryArchive
+
+    csv_path = os.path.join(tmp, "sent_jobs.csv")
+    write_history(csv_path, history_size)
+    store = JobStore(os.path.join(tmp, "jobs.db"))
+    store.migrate(csv_path, os.path.join(tmp, "missing.json"))
+    store.archive = HistoryArchive(os.path.join(tmp, "history"))
+    store.archive_sent(-1)
+    store.close()
+
+
+# loading the archived history of some companies, or all of them, into a dataframe. the archive
+# is built in another process so the peak rss is only the load's
+def bench_history_load(history_size, companies=None):
+    from history_archive import HistoryArchive
+
+    with tempfile.TemporaryDirectory() as tmp:
+        builder = multiprocessing.get_context("spawn").Process(target=_build_archive, args=(tmp, history_size))
+        builder.start()
+        builder.join()
+        start = time.perf_counter()
+        frame = HistoryArchive(os.path.join(tmp, "history")).load(companies, columns=["company", "title", "link", "location"])
+        seconds = time.perf_counter() - start
+    return {"items": len(frame), "seconds": seconds, "latency": [seconds], "unit": "load"}
+
+
+STAGES = {
+    "workday_api": bench_workday_api,
+    "workday_selenium": bench_workday_selenium,
+    "garmin": bench_garmin,
+    "filter": bench_filter,
+    "dedup": bench_dedup,
+    "dedup_archive": partial(bench_dedup, archived=True),
+    "dedup_archive_new": partial(bench_dedup, archived=True, resent=False),
+    "history_load": bench_history_load,
+}
+
+
+def _child(stage, args, results):
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        result = STAGES[stage](*args)
+        latency = result.pop("latency")
+        result.update(_percentiles(latency))
+        result["peak_rss_mb"] = _peak_rss_mb()
+        results.put(result)
+    except Exception as e:
+        results.put({"error": repr(e)})
+
+
+def run_case(stage, case, args):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_child, args=(stage, args, results))
+    process.start()
+    result = results.get()
+    process.join()
+    result.update({"stage": stage, "case": case})
+    if "error" not in result:
+        result["throughput"] = result["items"] / result["seconds"] if result["seconds"] else None
+    return result
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:9.2f}" if seconds is not None else f"{'-':>9}"
+
+
+def print_results(results, baseline=None):
+    baseline = {(r["stage"], r["case"]): r for r in (baseline or []) if "error" not in r}
+    print(f"{'stage':<18} {'case':<22} {'items/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rss MB':>8}  unit")
+    for r in results:
+        if "error" in r:
+            print(f"{r['stage']:<18} {r['case']:<22} failed: {r['error']}")
+            continue
+        line = (f"{r['stage']:<18} {r['case']:<22} {r['throughput']:10.1f} {_ms(r['p50'])} {_ms(r['p95'])} "
+                f"{_ms(r['p99'])} {r['peak_rss_mb']:8.1f}  {r['unit']}")
+        old = baseline.get((r["stage"], r["case"]))
+        if old:
+            change = (r["throughput"] - old["throughput"]) / old["throughput"] * 100
+            line += f"  ({change:+.1f}% throughput vs baseline)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--selenium", action="store_true", help="also benchmark the selenium scrapers (needs chrome)")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes for a fast check")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every fixture response")
+    parser.add_argument("--output", help="write the results to this json file")
+    parser.add_argument("--compare", help="json results from an earlier run to compare against")
+    parser.add_argument("--stage", action="append", choices=list(STAGES), help="only run these stages")
+    args = parser.parse_args()
+
+    posting_sizes = [100, 500] if args.quick else [200, 2000]
+    history_sizes = [1_000, 10_000] if args.quick else [1_000, 10_000, 100_000]
+    keyword_sizes = [0, 100] if args.quick else [0, 100, 1000]
+    stages = args.stage or [s for s in STAGES if args.selenium or s not in ("workday_selenium", "garmin")]
+
+    results = []
+    for postings in posting_sizes:
+        server = start_fixture_server(postings, args.latency)
+        if "workday_api" in stages:
+            results.append(run_case("workday_api", f"{postings} postings", (f"{server.url}/External", postings)))
+        if "workday_selenium" in stages:
+            results.append(run_case("workday_selenium", f"{postings} postings", (f"{server.url}/External", postings)))
+        if "garmin" in stages:
+            results.append(run_case("garmin", f"{postings} postings", (f"{server.url}/careers-home/jobs", postings)))
+        server.shutdown()
+    if "filter" in stages:
+        for keywords in keyword_sizes:
+            results.append(run_case("filter", f"{keywords} extra keywords", (10_000, keywords)))
+    if "dedup" in stages:
+        for size in history_sizes:
+            results.append(run_case("dedup", f"{size} history rows", (size,)))
+    for stage in ("dedup_archive", "dedup_archive_new"):
+        if stage in stages:
+            for size in history_sizes:
+                results.append(run_case(stage, f"{size} history rows", (size,)))
+    if "history_load" in stages:
+        for size in history_sizes:
+            results.append(run_case("history_load", f"{size} rows, 1 company", (size, ["Company 0"])))
+            results.append(run_case("history_load", f"{size} rows, all", (size,)))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
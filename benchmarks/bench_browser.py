@@ -0,0 +1,97 @@
+# compares the browser profiles in company_scrapers/browser.py. for each profile a browser is
+# started against the fixture server and loads workday listing and detail pages the way the
+# selenium scrapers do, reporting how long each load takes, how many requests the server had
+# to answer, and the memory of chrome's processes read from /proc. needs chrome
+#
+#   python -m benchmarks.bench_browser [--pages 20] [--latency 0.05] [--profile lean]
+import argparse
+import os
+import statistics
+import time
+
+from benchmarks.bench import _percentiles
+from benchmarks.fixture_server import start_fixture_server
+from company_scrapers.browser import PROFILES, wait_for
+from company_scrapers.driver_pool import new_driver
+
+
+def _children(pid):
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return children
+
+
+# proportional set size (shared pages split between the processes using them) of the process
+# and everything it started, in MB. chrome runs as a dozen processes sharing most of their pages
+# so adding up rss would count the shared ones many times
+def tree_memory_mb(pid):
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(_children(current))
+        try:
+            with open(f"/proc/{current}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            pass
+    return total / 1024
+
+
+def _timed_load(driver, url, selector):
+    start = time.perf_counter()
+    driver.get(url)
+    wait_for(driver, selector)
+    return time.perf_counter() - start
+
+
+def bench_profile(profile, server, pages):
+    start = time.perf_counter()
+    driver = new_driver(profile)
+    startup = time.perf_counter() - start
+    try:
+        requests_before = server.requests
+        listing = [_timed_load(driver, f"{server.url}/External", "ul[role='list']") for _ in range(pages)]
+        detail = [
+            _timed_load(driver, f"{server.url}/External/job/Santa-Clara/Software-Engineer_R{i:06d}",
+                        "div[data-automation-id='job-posting-details']")
+            for i in range(pages)
+        ]
+        requests = server.requests - requests_before
+        memory = tree_memory_mb(driver.service.process.pid)
+    finally:
+        driver.quit()
+    return {"startup": startup, "listing": listing, "detail": detail, "requests": requests, "memory": memory}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20, help="listing and detail pages loaded per profile")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every fixture response")
+    parser.add_argument("--profile", action="append", choices=PROFILES, help="only run these profiles")
+    args = parser.parse_args()
+
+    server = start_fixture_server(200, args.latency)
+    print(f"{'profile':<10} {'startup s':>9} {'page':<8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'requests':>9} {'memory MB':>10}")
+    for profile in args.profile or PROFILES:
+        result = bench_profile(profile, server, args.pages)
+        for page in ("listing", "detail"):
+            samples = result[page]
+            cuts = _percentiles(samples)
+            print(f"{profile:<10} {result['startup']:9.2f} {page:<8} {statistics.mean(samples) * 1000:9.1f} "
+                  f"{cuts['p50'] * 1000:9.1f} {cuts['p95'] * 1000:9.1f} {result['requests']:9d} "
+                  f"{result['memory']:10.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# compares the compiled JobMatcher against the original filtering loop, which rebuilt a regex
+# for every job x location group x keyword x posting location
+#
+#   python -m benchmarks.bench_matcher [--jobs 5000] [--keywords 200]
+import argparse
+import random
+import re
+import time
+
+from matcher import JobMatcher, NON_US_KEYWORDS
+
+CITIES = [
+    "Santa Clara, California, US", "Austin, Texas, US", "New York, NY", "Remote - India",
+    "Bangalore, India", "Los Angeles, CA", "Seattle, WA", "Remote, US", "Toronto, Canada",
+    "San Francisco, California", "Manila, Philippines", "Brooklyn, New York",
+]
+TITLES = [
+    "Software Engineer", "Senior Backend Engineer", "Product Manager", "Full Stack Developer",
+    "Data Analyst", "Frontend Engineer II", "Mechanical Engineer", "Software Development Intern",
+]
+
+
+# the filtering from before JobMatcher, kept here as the baseline
+def original_match(job, key_groups, locations):
+    location_found = False
+    for _, keywords in locations.items():
+        for keyword in keywords:
+            keyword = keyword.lower()
+            pattern = r"\b" + re.escape(keyword) + r"\b"
+            for loc in job["location"]:
+                loc = loc.lower()
+                if "remote" in loc and keyword == "remote":
+                    if any(non_us in loc for non_us in NON_US_KEYWORDS):
+                        continue
+                if re.search(pattern, loc):
+                    location_found = True
+                    break
+            if location_found:
+                break
+        if location_found:
+            break
+    if not location_found:
+        return False
+
+    title = job["title"].lower()
+    for keywords in key_groups.values():
+        for keyword in keywords:
+            pattern = r"\b" + re.escape(keyword.lower()) + r"\b"
+            if re.search(pattern, title):
+                return True
+    return False
+
+
+def make_config(num_keywords):
+    key_groups = {
+        "software": ["software", "software engineering", "software developer"],
+        "fullstack": ["full stack", "full-stack", "fullstack"],
+        "backend": ["backend", "back-end", "back end"],
+        "frontend": ["frontend", "front-end", "front end"],
+    }
+    locations = {
+        "remote": ["remote"],
+        "california": ["california", "ca"],
+        "new_york": ["new york", "ny"],
+    }
+    # pad both sections with keywords that never match so the cost of a miss shows up
+    for i in range(num_keywords):
+        key_groups.setdefault(f"extra{i % 10}", []).append(f"keyword{i}")
+        locations.setdefault(f"extra{i % 10}", []).append(f"place{i}")
+    return {"key_groups": key_groups, "locations": locations}
+
+
+def make_jobs(num_jobs, seed=0):
+    rng = random.Random(seed)
+    return [
+        {"title": rng.choice(TITLES), "location": rng.sample(CITIES, rng.randint(1, 3))}
+        for _ in range(num_jobs)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--keywords", type=int, default=200)
+    args = parser.parse_args()
+
+    config = make_config(args.keywords)
+    jobs = make_jobs(args.jobs)
+
+    start = time.perf_counter()
+    expected = [original_match(job, config["key_groups"], config["locations"]) for job in jobs]
+    original_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = JobMatcher(config)
+    matched = [
+        matcher.match_location(job["location"]) is not None and matcher.match_title(job["title"]) is not None
+        for job in jobs
+    ]
+    matcher_time = time.perf_counter() - start
+
+    if matched != expected:
+        mismatches = sum(a != b for a, b in zip(matched, expected))
+        raise SystemExit(f"JobMatcher disagrees with the original filter on {mismatches} jobs")
+
+    print(f"{args.jobs} jobs, {args.keywords} extra keywords per section, {sum(matched)} matched")
+    print(f"original loop: {original_time * 1000:9.1f} ms  ({original_time / args.jobs * 1e6:8.1f} us/job)")
+    print(f"JobMatcher:    {matcher_time * 1000:9.1f} ms  ({matcher_time / args.jobs * 1e6:8.1f} us/job)")
+    print(f"speedup:       {original_time / matcher_time:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
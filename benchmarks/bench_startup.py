@@ -0,0 +1,92 @@
+# how long it takes to start main.py, from python's own import profile (python -X importtime).
+# every run is a fresh interpreter that only imports the module, so the numbers are what a cron
+# run pays before it does any work. it prints the median total, the modules that took longest
+# (cumulative, so a package includes what it imports) and which of the heavy dependencies got
+# imported at all, since those should only be loaded by the stages that use them
+#
+#   python -m benchmarks.bench_startup [--runs 10] [--top 15] [--module main]
+#   python -m benchmarks.bench_startup --output startup.json --compare old_startup.json
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# dependencies that should stay out of startup
+HEAVY = [
+    "selenium.webdriver", "chromedriver_autoinstaller", "jinja2", "asyncio", "aiohttp", "pandas", "pyarrow",
+]
+
+_CHECK = "import sys; import {module}; print(','.join(m for m in {heavy!r} if m in sys.modules))"
+
+
+# one cold import of module: (wall seconds, {module: (self us, cumulative us)}, heavy modules loaded)
+def profile_import(module):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHECK.format(module=module, heavy=HEAVY)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    wall = time.perf_counter() - start
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(own), int(cumulative))
+    loaded = [name for name in result.stdout.strip().split(",") if name]
+    return wall, times, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15, help="how many of the slowest imports to list")
+    parser.add_argument("--module", default="main", help="module to import")
+    parser.add_argument("--output", help="write the results to this json file")
+    parser.add_argument("--compare", help="json results from an earlier run to compare against")
+    args = parser.parse_args()
+
+    walls, totals, cumulative = [], [], {}
+    loaded = []
+    for _ in range(args.runs):
+        wall, times, loaded = profile_import(args.module)
+        walls.append(wall)
+        totals.append(times[args.module][1] / 1000)
+        for name, (_, total) in times.items():
+            cumulative.setdefault(name, []).append(total / 1000)
+
+    results = {
+        "module": args.module,
+        "import_ms": statistics.median(totals),
+        "process_ms": statistics.median(walls) * 1000,
+        "slowest": {
+            name: statistics.median(samples)
+            for name, samples in sorted(cumulative.items(), key=lambda item: -statistics.median(item[1]))[:args.top]
+        },
+        "heavy_loaded": loaded,
+    }
+
+    print(f"import {args.module}: {results['import_ms']:.1f} ms median over {args.runs} runs, "
+          f"{results['process_ms']:.1f} ms for the whole process")
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        change = (results["import_ms"] - old["import_ms"]) / old["import_ms"] * 100
+        print(f"  {change:+.1f}% vs baseline ({old['import_ms']:.1f} ms)")
+    print(f"\n{'module':<50} {'cumulative ms':>14}")
+    for name, ms in results["slowest"].items():
+        print(f"{name:<50} {ms:14.1f}")
+    print(f"\nheavy dependencies imported: {', '.join(loaded) or 'none'}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# local stand-in for workday and garmin career sites, built from the recorded pages in
+# benchmarks/fixtures. every site has `postings` jobs made from the recorded postings, newest
+# first, so the scrapers and the benchmarks can run without a network connection.
+#   /<site>                              workday listing page (selenium)
+#   /<site>/job/...                      workday job detail page (selenium), the listing
+#                                        links to it as /en-US/<site>/job/... like workday does
+#   /wday/cxs/<tenant>/<site>/jobs       workday jobs api (POST)
+#   /wday/cxs/<tenant>/<site>/job/...    workday job detail api
+#   /careers-home/jobs                   garmin listing page
+#   /static/...                          css, images and scripts the pages load
+#
+#   python -m benchmarks.fixture_server [--port 8000] [--postings 200] [--latency 0.05]
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+STATIC = {
+    ".css": ("text/css", b"body { font-family: Arial, sans-serif; }\n" * 200),
+    ".js": ("application/javascript", b"window.analytics = window.analytics || [];\n" * 200),
+    ".png": ("image/png", b"\x89PNG\r\n\x1a\n" + b"\x00" * 50_000),
+}
+
+
+def _read(name):
+    with open(os.path.join(FIXTURES, name), "r") as f:
+        return f.read()
+
+
+def _posted_on(days):
+    if days == 0:
+        return "Posted Today"
+    if days == 1:
+        return "Posted Yesterday"
+    if days >= 30:
+        return "Posted 30+ Days Ago"
+    return f"Posted {days} Days Ago"
+
+
+class FixtureSite:
+    def __init__(self, postings=200):
+        self.templates = json.loads(_read("workday_jobs.json"))["jobPostings"]
+        self.detail = json.loads(_read("workday_job.json"))
+        self.listing_html = _read("workday_listing.html")
+        self.job_html = _read("workday_job.html")
+        self.garmin_html = _read("garmin_listing.html")
+        self.postings = postings
+        self.sites = {} # site -> number of postings, for sites that need a different size
+
+    def count(self, site):
+        return self.sites.get(site, self.postings)
+
+    # posting i of a site, spread from today to 30+ days ago in order
+    def posting(self, site, i):
+        template = self.templates[i % len(self.templates)]
+        req_id = f"R{i:06d}"
+        path = re.sub(r"_[A-Z]+\d+$", f"_{req_id}", template["externalPath"])
+        return {
+            "title": template["title"],
+            "externalPath": path,
+            "locationsText": template["locationsText"],
+            "postedOn": _posted_on(i * 31 // max(self.count(site), 1)),
+            "bulletFields": [req_id],
+        }
+
+    def jobs_page(self, site, offset, limit):
+        total = self.count(site)
+        postings = [self.posting(site, i) for i in range(offset, min(offset + limit, total))]
+        # workday only sends the total with the first page
+        return {"total": total if offset == 0 else 0, "jobPostings": postings}
+
+    def job_detail(self, path):
+        match = re.search(r"_R(\d+)$", path)
+        i = int(match.group(1)) if match else 0
+        template = self.templates[i % len(self.templates)]
+        detail = json.loads(json.dumps(self.detail))
+        info = detail["jobPostingInfo"]
+        info["title"] = template["title"]
+        info["jobReqId"] = f"R{i:06d}"
+        if "Locations" not in template["locationsText"]:
+            info["location"] = template["locationsText"]
+            info["additionalLocations"] = []
+        return detail
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # send each response in one write, otherwise delayed acks add ~40ms to every request
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, content_type, body):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if isinstance(body, str):
+            body = body.encode()
+        # the api responses carry an etag like workday's, so conditional requests get a 304
+        etag = None
+        if content_type == "application/json" and status == 200:
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                status, body = 304, b""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.requests += 1
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        match = re.fullmatch(r"/wday/cxs/[^/]+/([^/]+)/jobs", path)
+        if not match:
+            return self._send(404, "text/plain", "not found")
+        request = json.loads(body or b"{}")
+        page = self.server.fixtures.jobs_page(match.group(1), request.get("offset", 0), request.get("limit", 20))
+        self._send(200, "application/json", json.dumps(page))
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        fixtures = self.server.fixtures
+
+        if path.startswith("/static/"):
+            content_type, body = STATIC.get(os.path.splitext(path)[1], ("text/plain", b""))
+            return self._send(200, content_type, body)
+
+        if path == "/careers-home/jobs":
+            postings = [
+                {"title": p["title"], "link": f"{self.server.url}/careers-home/jobs/{p['bulletFields'][0]}",
+                 "location": p["locationsText"], "position_type": "Full Time"}
+                for p in (fixtures.posting("garmin", i) for i in range(fixtures.count("garmin")))
+            ]
+            return self._send(200, "text/html", fixtures.garmin_html.replace("{{postings}}", json.dumps(postings)))
+
+        match = re.fullmatch(r"/wday/cxs/[^/]+/[^/]+(/job/.+)", path)
+        if match:
+            return self._send(200, "application/json", json.dumps(fixtures.job_detail(match.group(1))))
+
+        match = re.fullmatch(r"(?:/[a-z]{2}-[A-Z]{2})?/([^/]+)(/job/.+)", path)
+        if match:
+            info = fixtures.job_detail(match.group(2))["jobPostingInfo"]
+            locations = [info["location"]] + info["additionalLocations"]
+            page = (fixtures.job_html
+                    .replace("{{title}}", html.escape(info["title"]))
+                    .replace("{{locations}}", "".join(f"<dd>{html.escape(loc)}</dd>" for loc in locations))
+                    .replace("{{description}}", info["jobDescription"]))
+            return self._send(200, "text/html", page)
+
+        match = re.fullmatch(r"/([^/]+)/?", path)
+        if match:
+            site = match.group(1)
+            page = (fixtures.listing_html
+                    .replace("{{api}}", f"/wday/cxs/bench/{site}")
+                    .replace("{{page_url}}", f"{self.server.url}/en-US/{site}"))
+            return self._send(200, "text/html", page)
+
+        self._send(404, "text/plain", "not found")
+
+
+# starts the server on a background thread, use server.url for the address and
+# server.shutdown() to stop it. latency is added to every response in seconds
+def start_fixture_server(postings=200, latency=0.0, port=0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), FixtureHandler)
+    server.daemon_threads = True
+    server.fixtures = FixtureSite(postings)
+    server.latency = latency
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--postings", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = start_fixture_server(args.postings, args.latency, args.port)
+    print(f"Serving fixtures at {server.url}, e.g. {server.url}/External and {server.url}/careers-home/jobs")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# local stand-in for the smtp server so emails can be sent without reaching gmail. it speaks
+# enough smtp for smtplib (no tls or auth, so leave EMAIL_PASSWORD empty), keeps every message
+# it receives in server.messages and can fail a share of them to exercise the retries.
+#
+#   python -m benchmarks.smtp_server [--port 8025] [--fail-rate 0.2]
+#   SMTP_HOST=localhost SMTP_PORT=8025 SMTP_SSL=false python main.py
+import argparse
+import random
+import socketserver
+import threading
+import time
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+        self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self._reply("220 localhost stand-in ready")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self._reply("250 localhost")
+            elif verb == "MAIL":
+                sender, recipients = command.split(":", 1)[1].strip(), []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[1].strip().strip("<>"))
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    data.append(line)
+                if server.rng.random() < server.fail_rate:
+                    self._reply("451 Temporary failure, try again")
+                else:
+                    with server.lock:
+                        server.messages.append({"from": sender, "to": recipients, "data": b"".join(data)})
+                    self._reply("250 OK")
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self._reply("250 OK")
+            elif verb == "NOOP":
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+# starts the server on a background thread, server.port is the port it listens on.
+# fail_rate is the share of messages answered with a temporary failure
+def start_smtp_server(port=0, fail_rate=0.0, seed=0):
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", port), SMTPHandler)
+    server.daemon_threads = True
+    server.messages = []
+    server.connections = 0
+    server.fail_rate = fail_rate
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = start_smtp_server(args.port, args.fail_rate)
+    print(f"SMTP stand-in listening on localhost:{server.port}")
+    try:
+        while True:
+            time.sleep(1)
+            with server.lock:
+                messages, server.messages = server.messages, []
+            for message in messages:
+                print(f"Message from {message['from']} to {', '.join(message['to'])}, {len(message['data'])} bytes")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
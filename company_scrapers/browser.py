@@ -0,0 +1,140 @@
+# chrome settings and page waits for the selenium scrapers. the scrapers only read text out
+# of the dom, so the "lean" profile skips everything else a career site loads: images, fonts,
+# stylesheets and media are blocked through chrome devtools (Network.setBlockedURLs) along
+# with analytics and tag manager domains, and the gpu, extensions and background networking
+# are turned off. pages are loaded with the "eager" strategy so driver.get returns once the
+# html is parsed instead of after every subresource, and the waits below watch the dom with a
+# MutationObserver instead of polling webdriver every half second. "default" is plain headless
+# chrome with the polling waits, and stays the default until the lean profile has been measured
+# against real career sites with benchmarks/bench_browser.py
+import logging
+
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+logger = logging.getLogger(__name__)
+
+PROFILES = ("default", "lean")
+
+# url patterns (with * wildcards) that the lean profile never loads
+BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3",
+    "*.css",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*facebook.net*",
+    "*hotjar.com*", "*newrelic.com*", "*nr-data.net*", "*optimizely.com*", "*onetrust.com*",
+    "*cookielaw.org*", "*linkedin.com/px*", "*bing.com/bat*", "*qualtrics.com*", "*clarity.ms*",
+]
+
+LEAN_ARGUMENTS = [
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-features=Translate,OptimizationHints,MediaRouter,AutofillServerCommunication",
+    "--blink-settings=imagesEnabled=false",
+    "--disable-dev-shm-usage",
+    "--no-first-run",
+    "--mute-audio",
+]
+
+# longest a script, and so a wait, can run. the waits in the scrapers are shorter than this
+SCRIPT_TIMEOUT = 60
+
+
+def chrome_options(profile="default"):
+    options = Options()
+    options.add_argument("--headless") # Run in headless mode after testing is complete
+    if profile == "lean":
+        for argument in LEAN_ARGUMENTS:
+            options.add_argument(argument)
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+        options.page_load_strategy = "eager"
+    return options
+
+
+# called on every new browser, the blocked urls stay in place for the life of the tab
+def prepare_driver(driver, profile="default", blocked_urls=None):
+    driver.set_script_timeout(SCRIPT_TIMEOUT)
+    # read by the waits below
+    driver.event_waits = profile == "lean"
+    if profile != "lean":
+        return
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS if blocked_urls is None else blocked_urls})
+    except WebDriverException as e:
+        logger.warning("Could not block resources in the browser: %s", e)
+
+
+_WAIT_FOR_ELEMENT = """
+const [selector, timeout, done] = arguments;
+if (document.querySelector(selector)) return done(true);
+const observer = new MutationObserver(() => {
+    if (document.querySelector(selector)) {
+        observer.disconnect();
+        clearTimeout(timer);
+        done(true);
+    }
+});
+observer.observe(document.documentElement, {childList: true, subtree: true});
+const timer = setTimeout(() => { observer.disconnect(); done(false); }, timeout);
+"""
+
+_WAIT_FOR_REMOVAL = """
+const [element, timeout, done] = arguments;
+if (!element.isConnected) return done(true);
+const observer = new MutationObserver(() => {
+    if (!element.isConnected) {
+        observer.disconnect();
+        clearTimeout(timer);
+        done(true);
+    }
+});
+observer.observe(document.documentElement, {childList: true, subtree: true});
+const timer = setTimeout(() => { observer.disconnect(); done(false); }, timeout);
+"""
+
+
+# returns as soon as an element matching the css selector is in the page, raises
+# TimeoutException if none shows up. browsers with the lean profile watch the dom for it, the
+# others poll webdriver, and so does a lean one if the script can't run (the page navigated away
+# while it was waiting)
+def wait_for(driver, selector, timeout=10):
+    if getattr(driver, "event_waits", False):
+        try:
+            found = driver.execute_async_script(_WAIT_FOR_ELEMENT, selector, int(timeout * 1000))
+        except TimeoutException:
+            raise
+        except WebDriverException:
+            found = None
+        if found is not None:
+            if not found:
+                raise TimeoutException(f"{selector} did not appear within {timeout}s")
+            return
+    WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
+
+
+# returns as soon as element has been removed from the page, e.g. the old job cards once the
+# next page has rendered
+def wait_until_removed(driver, element, timeout=10):
+    if getattr(driver, "event_waits", False):
+        try:
+            removed = driver.execute_async_script(_WAIT_FOR_REMOVAL, element, int(timeout * 1000))
+        except StaleElementReferenceException:
+            return
+        except TimeoutException:
+            raise
+        except WebDriverException:
+            removed = None
+        if removed is not None:
+            if not removed:
+                raise TimeoutException(f"page did not change within {timeout}s")
+            return
+    WebDriverWait(driver, timeout).until(EC.staleness_of(element))
@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# starting chrome is the slowest part of scraping with selenium, so instead of every scraper
+# and every location worker starting its own browser they lease one from this pool. browsers
+# are kept open between leases, reset so nothing carries over, and replaced once they crash
+# or have been used max_uses times (chrome slowly leaks memory on long sessions). profile is
+# "default" or "lean", see browser.py. selenium is only imported once a browser is started, so
+# runs that only use the workday api don't load it
+
+# chromedriver for each chrome version it was installed for, see install_chromedriver
+CHROMEDRIVER_CACHE = "chromedriver.json"
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+# makes sure a chromedriver matching the installed chrome is on PATH, once per process and only
+# when a browser is needed. finding the matching version goes over the network, so the driver
+# installed for a chrome version is remembered and reused until chrome is updated
+def install_chromedriver(cache_path=CHROMEDRIVER_CACHE):
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        _installed = True
+        import chromedriver_autoinstaller
+
+        try:
+            chrome_version = chromedriver_autoinstaller.get_chrome_version()
+        except Exception as e:
+            logger.warning("Could not find chrome's version, using the chromedriver on PATH: %s", e)
+            return
+        try:
+            with open(cache_path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
+        path = cached.get(chrome_version) if chrome_version else None
+        if path and os.path.isfile(path):
+            driver_dir = os.path.dirname(path)
+            if driver_dir not in os.environ.get("PATH", "").split(os.pathsep):
+                os.environ["PATH"] = driver_dir + os.pathsep + os.environ.get("PATH", "")
+            return
+        try:
+            with metrics.timer("chromedriver_install"):
+                path = chromedriver_autoinstaller.install()
+        except Exception as e:
+            logger.warning("Could not install chromedriver, using the one on PATH: %s", e)
+            return
+        if chrome_version and path:
+            with open(cache_path, "w") as f:
+                json.dump({chrome_version: path}, f)
+
+
+def new_driver(profile="default", blocked_urls=None):
+    from selenium import webdriver
+
+    from company_scrapers.browser import chrome_options, prepare_driver
+
+    install_chromedriver()
+    with metrics.timer("driver_startup"):
+        driver = webdriver.Chrome(options=chrome_options(profile))
+        prepare_driver(driver, profile, blocked_urls)
+    metrics.incr("driver_starts")
+    return driver
+
+
+class DriverPool:
+    def __init__(self, size=4, max_uses=50, profile="default", blocked_urls=None):
+        self.size = size
+        self.max_uses = max_uses
+        self.profile = profile
+        self.blocked_urls = blocked_urls
+        self._idle = queue.LifoQueue() # most recently used browser first, it's the warmest
+        self._slots = threading.BoundedSemaphore(size)
+        self._uses = {}
+        # every browser started and not quit yet, idle or leased, so close() can quit them all
+        self._drivers = {}
+        self._closed = False
+        self._lock = threading.Lock()
+
+    # usage:
+    #   with pool.lease() as driver:
+    #       driver.get(url)
+    # blocks until a browser is free if all of them are leased out
+    @contextmanager
+    def lease(self):
+        self._slots.acquire()
+        driver = None
+        try:
+            driver = self._acquire()
+            yield driver
+        finally:
+            if driver is not None:
+                self._release(driver)
+            self._slots.release()
+
+    def _acquire(self):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                if self._closed:
+                    raise RuntimeError("the browser pool has been closed")
+                driver = new_driver(self.profile, self.blocked_urls)
+                with self._lock:
+                    closed = self._closed
+                    if not closed:
+                        self._uses[id(driver)] = 0
+                        self._drivers[id(driver)] = driver
+                if closed:
+                    self._quit(driver)
+                    raise RuntimeError("the browser pool has been closed")
+                return driver
+
+            if self.healthy(driver):
+                return driver
+            self._discard(driver)
+
+    def _release(self, driver):
+        with self._lock:
+            self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+            worn_out = self._uses[id(driver)] >= self.max_uses
+
+        # a browser given back after close() has been quit already
+        if self._closed or worn_out or not self._reset(driver):
+            self._discard(driver)
+        else:
+            self._idle.put(driver)
+
+    # a crashed browser or a dead chromedriver raises on any command
+    def healthy(self, driver):
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    # clear anything the last lease left behind so the next one starts from a blank tab
+    def _reset(self, driver):
+        try:
+            for handle in driver.window_handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(driver.window_handles[0])
+            driver.delete_all_cookies()
+            driver.get("about:blank")
+            return True
+        except Exception as e:
+            logger.info("Recycling browser that failed to reset: %s", e)
+            return False
+
+    def _discard(self, driver):
+        with self._lock:
+            self._uses.pop(id(driver), None)
+            started = self._drivers.pop(id(driver), None) is not None
+        if started:
+            metrics.incr("driver_recycles")
+            self._quit(driver)
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    # quits every browser the pool started, including the ones still leased. a scraper that's
+    # still using one (a company that timed out keeps running on its thread) gets an error on its
+    # next command instead of leaving chrome running after the process exits
+    def close(self):
+        with self._lock:
+            self._closed = True
+            drivers = list(self._drivers.values())
+            self._drivers.clear()
+            self._uses.clear()
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for driver in drivers:
+            self._quit(driver)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# the pool is shared by every scraper in the process. main.py sizes it from the config
+# before any scraping starts, otherwise the defaults are used
+def configure_pool(size=4, max_uses=50, profile="default", blocked_urls=None):
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = DriverPool(size, max_uses, profile, blocked_urls)
+    return _pool
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DriverPool()
+        return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
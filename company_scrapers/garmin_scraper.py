@@ -1,69 +1,86 @@
-from selenium import webdriver
+import logging
+
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from company_scrapers.browser import wait_for, wait_until_removed
+from company_scrapers.driver_pool import get_pool, close_pool
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+GARMIN_URL = "https://careers.garmin.com/careers-home/jobs"
 
 # garmin has a div named mat-paginator-range-label with contains the number of jobs we've seen out of the 
-# total number of jobs, so we can use that gauge when we get to the last page
-def scrape_garmin():
-    options = Options()
-    options.add_argument("--headless") # Run in headless mode after testing is complete
-    driver = webdriver.Chrome(options=options)
-    jobs = []
+# total number of jobs, so we can use that gauge when we get to the last page.
+# each page's jobs are yielded before moving on to the next
+def scrape_garmin(url=GARMIN_URL):
+    count = 0
     try:
-        url = "https://careers.garmin.com/careers-home/jobs"
-        driver.get(url)
-        wait = WebDriverWait(driver, 10)
-        # wait until the job cards are loaded
-        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, ".mat-accordion.cards")))
+        with get_pool().lease() as driver:
+            with metrics.timer("page_load"):
+                driver.get(url)
+                # wait until the job cards are loaded
+                wait_for(driver, ".mat-accordion.cards")
 
-        # get the job cards
-        while True:
-            # wait for the jobs cards to load
-            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, ".mat-accordion.cards")))
-            job_cards = driver.find_elements(By.CLASS_NAME, "mat-expansion-panel")
-            for job_card in job_cards:
-                try:
-                    title_tag = job_card.find_element(By.CLASS_NAME, "job-title-link")
-                    title = title_tag.find_element(By.TAG_NAME, "span").text
-                    # print(title)
-                    link = job_card.find_element(By.TAG_NAME, "a").get_attribute("href")
-                    job_description_tag = job_card.find_element(By.TAG_NAME, "mat-panel-description")
-                    job_location = job_description_tag.find_element(By.CSS_SELECTOR, "span .label-value.location").text
-                    position_type = job_description_tag.find_element(By.CSS_SELECTOR, "span .label-value.tags3").text
+            # get the job cards
+            while True:
+                # wait for the jobs cards to load
+                wait_for(driver, ".mat-accordion.cards")
+                job_cards = driver.find_elements(By.CLASS_NAME, "mat-expansion-panel")
+                metrics.incr("pages")
+                metrics.incr("cards", len(job_cards))
+                jobs = []
+                for job_card in job_cards:
+                    try:
+                        title_tag = job_card.find_element(By.CLASS_NAME, "job-title-link")
+                        title = title_tag.find_element(By.TAG_NAME, "span").text
+                        # print(title)
+                        link = job_card.find_element(By.TAG_NAME, "a").get_attribute("href")
+                        job_description_tag = job_card.find_element(By.TAG_NAME, "mat-panel-description")
+                        job_location = job_description_tag.find_element(By.CSS_SELECTOR, "span .label-value.location").text
+                        position_type = job_description_tag.find_element(By.CSS_SELECTOR, "span .label-value.tags3").text
 
-                    print(f"Title: {title}, Location: {job_location}, Position Type: {position_type}")
-                    jobs.append({
-                        "title": title,
-                        "link": link,
-                        "location": job_location,
-                        "position_type": position_type
-                    })
-                except Exception as e:
-                    print(f"Error with job: {e}")
-            
-            # check if on last page, if not then move on to next page and go up the loop
-            # if on last page, break out of the loop
-            paginator = driver.find_element(By.CSS_SELECTOR, "div .mat-paginator-range-label")
-            paginator_text = paginator.text
-            job_num = paginator_text.split(" ")[2]
-            total_jobs = paginator_text.split(" ")[4]
-            print(f"Jobs seen: {job_num}, Total jobs: {total_jobs}")
-            if job_num == total_jobs:
-                print("Reached the last page.")
-                break
-            else:
-                pag = driver.find_element(By.CSS_SELECTOR, "div .mat-paginator-range-actions")      
-                next_button = pag.find_element(By.CSS_SELECTOR, "button[aria-label='Next Page of Job Search Results']")
-                # print(next_button.get_attribute("outerHTML"))
-                driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", next_button)
-                driver.execute_script("arguments[0].click();", next_button)
+                        logger.debug("Title: %s, Location: %s, Position Type: %s", title, job_location, position_type)
+                        jobs.append({
+                            "title": title,
+                            "link": link,
+                            "location": job_location,
+                            "position_type": position_type
+                        })
+                    except Exception as e:
+                        logger.warning("Error with job: %s", e)
+                count += len(jobs)
+                yield from jobs
 
-    finally:
-        driver.quit()
-        return jobs
+                # check if on last page, if not then move on to next page and go up the loop
+                # if on last page, break out of the loop
+                paginator = driver.find_element(By.CSS_SELECTOR, "div .mat-paginator-range-label")
+                paginator_text = paginator.text
+                job_num = paginator_text.split(" ")[2]
+                total_jobs = paginator_text.split(" ")[4]
+                logger.info("Jobs seen: %s, Total jobs: %s", job_num, total_jobs)
+                if job_num == total_jobs:
+                    logger.info("Reached the last page.")
+                    break
+                else:
+                    pag = driver.find_element(By.CSS_SELECTOR, "div .mat-paginator-range-actions")      
+                    next_button = pag.find_element(By.CSS_SELECTOR, "button[aria-label='Next Page of Job Search Results']")
+                    # print(next_button.get_attribute("outerHTML"))
+                    driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", next_button)
+                    driver.execute_script("arguments[0].click();", next_button)
+                    # wait for the previous cards to be replaced so the same page isn't read twice
+                    if job_cards:
+                        wait_until_removed(driver, job_cards[0])
+
+    except Exception as e:
+        # the pages read before the error have been yielded already, the caller decides what to
+        # keep and the company is still reported as failed
+        logger.error("Error scraping %s after %d jobs: %s", url, count, e)
+        metrics.incr("errors")
+        raise
 
 
 if __name__ == "__main__":
-    scrape_garmin()
\ No newline at end of file
+    try:
+        jobs = list(scrape_garmin())
+    finally:
+        close_pool()
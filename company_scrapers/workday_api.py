@@ -0,0 +1,245 @@
+import json
+import logging
+import re
+from urllib.parse import urlparse
+
+import urllib3
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# workday career sites are rendered from a json api (the "cxs" endpoint), so instead of
+# driving a browser we can post the same search request the page makes and page through
+# the results directly. one pool manager is shared by every scrape so connections to the
+# same workday data center (wd1, wd5, ...) are reused across companies
+PAGE_SIZE = 20
+http = urllib3.PoolManager(
+    num_pools=50,
+    maxsize=8,
+    retries=urllib3.Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                          allowed_methods=["GET", "POST"]),
+    timeout=urllib3.Timeout(connect=10, read=30),
+    headers={"Accept": "application/json", "Content-Type": "application/json"},
+)
+
+# a fetch_cache.FetchCache, set by main.py when the fetch cache is enabled
+fetch_cache = None
+
+
+def set_fetch_cache(cache):
+    global fetch_cache
+    fetch_cache = cache
+
+
+# locale prefixes that can appear before the site name, e.g. /en-US/DraftKings/jobs
+def _is_locale(part):
+    return len(part) == 5 and part[2] == "-"
+
+
+# derives everything we need for the api from the career site url used in main.py
+#   https://intel.wd1.myworkdayjobs.com/External               -> tenant intel, site External
+#   https://draftkings.wd1.myworkdayjobs.com/en-US/DraftKings/jobs -> tenant draftkings, site DraftKings
+#   https://wd1.myworkdaysite.com/en-US/recruiting/snapchat/snap -> tenant snapchat, site snap
+# tenant and site can be passed in directly for hosts that don't follow the pattern (e.g. a local test server)
+def parse_workday_url(url, tenant=None, site=None):
+    parsed = urlparse(url)
+    base = f"{parsed.scheme}://{parsed.netloc}"
+    parts = [part for part in parsed.path.split("/") if part]
+    # the paths in the job postings are relative to the career site page, so keep the path up
+    # to the site name. the links built from them are normalized, see normalize_link
+    prefix = []
+    if parts and _is_locale(parts[0]):
+        prefix.append(parts.pop(0))
+
+    if parts and parts[0] == "recruiting":
+        # myworkdaysite.com urls have the tenant in the path instead of the subdomain
+        tenant = tenant or parts[1]
+        prefix.extend(parts[:2])
+        parts = parts[2:]
+    else:
+        tenant = tenant or parsed.hostname.split(".")[0]
+
+    site = site or parts[0]
+    page_url = "/".join([base] + prefix + parts[:1])
+
+    return {
+        "base": base,
+        "tenant": tenant,
+        "site": site,
+        "api": f"{base}/wday/cxs/{tenant}/{site}",
+        "page_url": page_url,
+    }
+
+
+# workday serves a posting with or without a locale in its path, and the hrefs on the career
+# site page have one (/en-US/External/job/...) while the api's paths only do if the url in
+# main.py has one. links are saved without it so a posting has the same link whichever engine
+# read it and whatever locale the page was in
+def normalize_link(link):
+    parsed = urlparse(link)
+    parts = parsed.path.split("/")
+    if len(parts) > 1 and _is_locale(parts[1]):
+        parsed = parsed._replace(path="/".join(parts[:1] + parts[2:]))
+    return parsed.geturl()
+
+
+def _send(method, url, data, headers=None):
+    response = http.request(method, url, body=data, headers={**http.headers, **(headers or {})})
+    # urllib3 already retried 429/5xx responses this many times
+    if response.retries is not None and response.retries.history:
+        metrics.incr("retries", len(response.retries.history))
+    return response.status, response.headers, response.data
+
+
+# resource_type is "listing" or "detail" and picks how long the response is cached for
+def _request_json(method, url, body=None, resource_type=None):
+    data = json.dumps(body, sort_keys=True).encode() if body is not None else None
+    if fetch_cache is not None and resource_type:
+        status, content = fetch_cache.fetch(method, url, data, resource_type,
+                                            lambda headers: _send(method, url, data, headers))
+    else:
+        status, _, content = _send(method, url, data)
+    if status != 200:
+        raise RuntimeError(f"{method} {url} returned {status}")
+    return json.loads(content)
+
+
+def fetch_job_page(site, offset, limit=PAGE_SIZE):
+    body = {"appliedFacets": {}, "limit": limit, "offset": offset, "searchText": ""}
+    with metrics.timer("page_load"):
+        page = _request_json("POST", f"{site['api']}/jobs", body, "listing")
+    metrics.incr("pages")
+    return page
+
+
+def fetch_job_details(detail_url):
+    with metrics.timer("detail_load"):
+        return _request_json("GET", detail_url, resource_type="detail")
+
+
+# turns a posting from the api into the same dict scrape_workday builds from a job card
+def parse_posting(site, posting):
+    bullet_fields = posting.get("bulletFields") or []
+    return {
+        "title": posting.get("title", ""),
+        "link": normalize_link(site["page_url"] + posting.get("externalPath", "")),
+        "location": posting.get("locationsText", ""),
+        "position_type": "N/A", # not provided in the listing, same as the job card
+        "job_id": bullet_fields[0] if bullet_fields else None,
+        "detail_url": site["api"] + posting.get("externalPath", ""),
+        "posted_on": posting.get("postedOn", ""),
+    }
+
+
+# "Posted Today" -> 0, "Posted Yesterday" -> 1, "Posted 3 Days Ago" -> 3, "Posted 30+ Days Ago" -> 30
+def posted_days_ago(posted_on):
+    text = (posted_on or "").lower()
+    if "today" in text:
+        return 0
+    if "yesterday" in text:
+        return 1
+    match = re.search(r"\d+", text)
+    return int(match.group()) if match else None
+
+
+# incremental mode: workday lists the newest postings first, so once stop_after postings in a
+# row are in known_links (or we reach high_water, the newest posting of the last run) the
+# rest of the pages only have postings we've already seen. the order is checked against each
+# posting's "Posted N Days Ago" and if a tenant doesn't list by date we read every page
+class Listing:
+    # where one career site's listing is up to and whether to stop, shared by iter_workday_api
+    # and the async engine. add() takes each page in order and returns its jobs, done is set
+    # once there's no need to read the next page
+    def __init__(self, site, known_links=None, stop_after=None, high_water=None):
+        self.site = site
+        self.known_links = known_links or set()
+        self.stop_after = stop_after
+        self.high_water = high_water
+        self.done = False
+        self.offset = 0
+        self.total = None
+        self.consecutive_known = 0
+        self.reached_high_water = False
+        self.date_ordered = True
+        self.last_age = 0
+
+    def add(self, page):
+        postings = page.get("jobPostings") or []
+        # workday only reports the total on the first page, later pages return 0
+        if self.total is None:
+            self.total = page.get("total", 0)
+
+        metrics.incr("cards", len(postings))
+        jobs = []
+        for posting in postings:
+            job = parse_posting(self.site, posting)
+            logger.debug("Title: %s, location: %s, job id: %s", job["title"], job["location"], job["job_id"])
+            jobs.append(job)
+
+            age = posted_days_ago(job["posted_on"])
+            if age is None or age < self.last_age:
+                self.date_ordered = False
+            else:
+                self.last_age = age
+
+            if job["link"] == self.high_water:
+                self.reached_high_water = True
+            if job["link"] in self.known_links:
+                self.consecutive_known += 1
+            else:
+                self.consecutive_known = 0
+
+        self.offset += len(postings)
+        logger.info("%d of %d jobs", self.offset, self.total)
+        if not postings or self.offset >= self.total:
+            logger.info("Reached the last page.")
+            self.done = True
+        elif self.stop_after and self.date_ordered and (self.consecutive_known >= self.stop_after or self.reached_high_water):
+            logger.info("Stopping at %d of %d jobs, the rest have been seen before.", self.offset, self.total)
+            self.done = True
+        return jobs
+
+
+# yields the jobs a page at a time as they're read, so they can be filtered while the next
+# page is still to come and a company's postings never all have to be held at once. if totals
+# is given the number of postings the site reported is appended to it once the first page is in
+def iter_workday_api(url, tenant=None, site_name=None, known_links=None, stop_after=None, high_water=None,
+                     totals=None):
+    site = parse_workday_url(url, tenant, site_name)
+    listing = Listing(site, known_links, stop_after, high_water)
+    jobs = listing.add(fetch_job_page(site, 0))
+    if totals is not None:
+        totals.append(listing.total)
+    yield from jobs
+    while not listing.done:
+        yield from listing.add(fetch_job_page(site, listing.offset))
+
+
+def scrape_workday_api(url, tenant=None, site_name=None, known_links=None, stop_after=None, high_water=None):
+    return list(iter_workday_api(url, tenant, site_name, known_links, stop_after, high_water))
+
+
+# the primary location plus the additional ones from a job's detail response
+def parse_locations(details):
+    info = details.get("jobPostingInfo", {})
+    locations = [info["location"]] if info.get("location") else []
+    locations.extend(info.get("additionalLocations") or [])
+    return locations
+
+
+# the listing only says "N Locations" for postings in several places, the detail
+# endpoint has the primary location plus the additional ones
+def resolve_locations_api(jobs):
+    for job in jobs:
+        if "Locations" not in job["location"]:
+            job["location"] = [job["location"]]
+            continue
+        try:
+            locations = parse_locations(fetch_job_details(job["detail_url"]))
+            logger.debug("Locations for %s: %s", job["title"], locations)
+            job["location"] = locations if locations else [job["location"]]
+        except Exception as e:
+            logger.warning("Error retrieving locations for job %s: %s", job["title"], e)
+            job["location"] = [job["location"]]  # Fallback to single location
+    return jobs
@@ -0,0 +1,212 @@
+# the "async" workday engine. every company is scraped from one asyncio event loop with
+# aiohttp, so instead of a thread per company blocked on one request at a time there can be
+# hundreds of listing and detail requests in flight at once. a global semaphore caps the
+# requests in flight and one per workday data center (wd1, wd5, ...) keeps any single host
+# from getting all of them. a company that runs past the timeout is cancelled, which unlike
+# a thread actually stops its requests
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from company_scrapers import workday_api
+from company_scrapers.workday_api import Listing, parse_workday_url, parse_locations, PAGE_SIZE
+from company_scrapers.driver_pool import get_pool
+from company_scrapers.workday_scraper import resolve_locations_parallel, _unresolved
+from metrics import metrics
+from scheduler import host_key
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRIES = 3
+BACKOFF = 0.5
+
+
+class WorkdayClient:
+    def __init__(self, session, max_requests=200, per_host=16, browsers=None):
+        self.session = session
+        self.requests = asyncio.Semaphore(max_requests)
+        self.per_host = per_host
+        self.hosts = {} # host key -> semaphore
+        # executor for selenium work, see in_browser
+        self.browsers = browsers
+
+    # runs func(*args) on a thread from the browser executor, which has one thread per browser in
+    # the pool. selenium work mostly waits for a browser to be free, on asyncio.to_thread's default
+    # executor it would take the threads the database calls need and hold up every other company.
+    # the company the task is scraping is carried over the same way asyncio.to_thread does it
+    async def in_browser(self, func, *args):
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.browsers, functools.partial(context.run, func, *args))
+
+    def _host(self, url):
+        key = host_key(url)
+        if key not in self.hosts:
+            self.hosts[key] = asyncio.Semaphore(self.per_host)
+        return self.hosts[key]
+
+    async def _send(self, method, url, data, headers):
+        # retries 429/5xx and connection errors with backoff, like the urllib3 pool in workday_api
+        for attempt in range(RETRIES + 1):
+            try:
+                async with self._host(url), self.requests:
+                    async with self.session.request(method, url, data=data, headers=headers) as response:
+                        body = await response.read()
+                        if response.status not in RETRY_STATUSES or attempt == RETRIES:
+                            return response.status, response.headers, body
+            except aiohttp.ClientError:
+                if attempt == RETRIES:
+                    raise
+            metrics.incr("retries")
+            await asyncio.sleep(BACKOFF * 2 ** attempt)
+
+    # same as workday_api._request_json, including the fetch cache when it's enabled
+    async def request_json(self, method, url, body=None, resource_type=None):
+        data = json.dumps(body, sort_keys=True).encode() if body is not None else None
+        cache = workday_api.fetch_cache
+        headers = {}
+        if cache is not None and resource_type:
+            cached, headers = await asyncio.to_thread(cache.lookup, method, url, data, resource_type)
+            if cached is not None:
+                return json.loads(cached)
+        status, response_headers, content = await self._send(method, url, data, headers)
+        if cache is not None and resource_type:
+            status, content = await asyncio.to_thread(
+                cache.update, method, url, data, resource_type, status, response_headers, content)
+        if status != 200:
+            raise RuntimeError(f"{method} {url} returned {status}")
+        return json.loads(content)
+
+    async def fetch_job_page(self, site, offset, limit=PAGE_SIZE):
+        body = {"appliedFacets": {}, "limit": limit, "offset": offset, "searchText": ""}
+        with metrics.timer("page_load"):
+            page = await self.request_json("POST", f"{site['api']}/jobs", body, "listing")
+        metrics.incr("pages")
+        return page
+
+    async def fetch_job_details(self, detail_url):
+        with metrics.timer("detail_load"):
+            return await self.request_json("GET", detail_url, resource_type="detail")
+
+    # async version of workday_api.scrape_workday_api. in incremental mode the pages are read
+    # one after another so it can stop early, otherwise every page after the first (which has
+    # the total) is requested at once. totals is the same as iter_workday_api's
+    async def scrape(self, url, tenant=None, site_name=None, known_links=None, stop_after=None, high_water=None,
+                     totals=None):
+        site = parse_workday_url(url, tenant, site_name)
+        listing = Listing(site, known_links, stop_after, high_water)
+        jobs = listing.add(await self.fetch_job_page(site, 0))
+        if totals is not None:
+            totals.append(listing.total)
+        if stop_after:
+            while not listing.done:
+                jobs.extend(listing.add(await self.fetch_job_page(site, listing.offset)))
+            return jobs
+        if listing.done:
+            return jobs
+
+        offsets = range(listing.offset, listing.total, PAGE_SIZE)
+        pages = await asyncio.gather(*(self.fetch_job_page(site, offset) for offset in offsets))
+        for page in pages:
+            jobs.extend(listing.add(page))
+            if listing.done:
+                break
+        return jobs
+
+    async def _resolve(self, job):
+        try:
+            locations = parse_locations(await self.fetch_job_details(job["detail_url"]))
+            logger.debug("Locations for %s: %s", job["title"], locations)
+            job["location"] = locations if locations else [job["location"]]
+        except Exception as e:
+            logger.warning("Error retrieving locations for job %s: %s", job["title"], e)
+            job["location"] = [job["location"]]
+
+    # async version of workday_scraper.resolve_workday_locations, the detail requests for
+    # every job run concurrently and jobs read by selenium are resolved on a browser thread
+    async def resolve_locations(self, jobs, cache=None):
+        multiple = [job for job in jobs if "Locations" in job["location"]]
+        for job in jobs:
+            if "Locations" not in job["location"]:
+                job["location"] = [job["location"]]
+
+        if cache is not None and multiple:
+            cached = await asyncio.to_thread(cache.cached_locations, multiple)
+            metrics.incr("location_cache_hits", len(cached))
+            for job in multiple:
+                if job["link"] in cached:
+                    job["location"] = cached[job["link"]]
+            multiple = [job for job in multiple if job["link"] not in cached]
+
+        from_browser = [job for job in multiple if not job.get("detail_url")]
+        await asyncio.gather(*(self._resolve(job) for job in multiple if job.get("detail_url")))
+        if from_browser:
+            await self.in_browser(resolve_locations_parallel, from_browser)
+        for job in multiple:
+            if isinstance(job["location"], str):
+                job["location"] = [job["location"]]
+
+        if cache is not None:
+            await asyncio.to_thread(cache.save_locations, [job for job in multiple if not _unresolved(job)])
+        return jobs
+
+
+# deadline is when the run's budget runs out, as time.monotonic(). a company still running then is
+# cancelled and reported as skipped, not timed out, so it isn't counted as a failure and stays due
+async def _run(company, scraper, client, timeout, deadline=None):
+    start = time.monotonic()
+    cut_off = deadline is not None and deadline - start < timeout
+    with metrics.company(company):
+        try:
+            with metrics.timer("company_total"):
+                output = await asyncio.wait_for(scraper(client), deadline - start if cut_off else timeout)
+            return {"company": company, "status": "ok", "output": output, "error": None,
+                    "duration": time.monotonic() - start}
+        except asyncio.TimeoutError:
+            if cut_off:
+                logger.warning("Out of time, %s is skipped until the next run.", company)
+                return {"company": company, "status": "skipped", "output": None, "error": None,
+                        "duration": time.monotonic() - start}
+            metrics.incr("timeouts")
+            return {"company": company, "status": "timeout", "output": None, "error": None,
+                    "duration": time.monotonic() - start}
+        except Exception as e:
+            metrics.incr("errors")
+            return {"company": company, "status": "error", "output": None, "error": e,
+                    "duration": time.monotonic() - start}
+
+
+async def _run_all(tasks, max_requests, per_host, timeout, budget, browsers):
+    deadline = time.monotonic() + budget if budget is not None else None
+    connector = aiohttp.TCPConnector(limit=max_requests, ttl_dns_cache=300)
+    session_timeout = aiohttp.ClientTimeout(sock_connect=10, sock_read=30)
+    headers = {"Accept": "application/json", "Content-Type": "application/json"}
+    async with aiohttp.ClientSession(connector=connector, timeout=session_timeout, headers=headers) as session:
+        client = WorkdayClient(session, max_requests, per_host, browsers)
+        for company in tasks:
+            logger.info("Running: %s", company)
+        return await asyncio.gather(
+            *(_run(company, scraper, client, timeout, deadline) for company, (url, scraper) in tasks.items())
+        )
+
+
+# same as scheduler.run_companies but every company runs at once on one event loop, limited by
+# requests in flight rather than companies. tasks is a dict of company -> (url, scraper) where
+# scraper is a coroutine function taking the WorkdayClient. returns the result dicts once every
+# company has finished or timed out. every company starts right away, so the budget (seconds)
+# cancels the ones still running when it's used up.
+# the timeout and budget only cancel what runs on the loop. work handed to a thread (the selenium
+# fallback, resolving locations with the browser, database calls) can't be interrupted: the
+# company is reported as timed out on time, but the thread keeps going until it's done and this
+# waits for it before returning, so a stuck browser can hold up the end of the run by up to the
+# selenium waits and retries
+def run_companies_async(tasks, max_requests=200, per_host=16, timeout=600, budget=None):
+    with ThreadPoolExecutor(max_workers=get_pool().size, thread_name_prefix="browser") as browsers:
+        return asyncio.run(_run_all(tasks, max_requests, per_host, timeout, budget, browsers))
@@ -1,133 +1,304 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-
-
-def scrape_workday(url):
-    options = Options()
-    options.add_argument("--headless") # Run in headless mode after testing is complete
-    driver = webdriver.Chrome(options=options)
-    jobs = []
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import ExitStack
+
+from selenium.common.exceptions import TimeoutException
+from company_scrapers.workday_api import iter_workday_api, normalize_link, resolve_locations_api
+from company_scrapers.driver_pool import get_pool
+from metrics import metrics, current_company
+
+logger = logging.getLogger(__name__)
+
+
+# "api" reads the postings from workday's json endpoint and only falls back to the
+# browser if that fails, "selenium" always uses the browser. known_links, stop_after and
+# high_water turn on incremental scraping, which only the api supports (see iter_workday_api).
+# jobs are yielded a page at a time as they're read. totals gets the number of postings the api
+# reported, selenium doesn't report one
+def scrape_workday(url, engine="api", known_links=None, stop_after=None, high_water=None, totals=None):
+    if engine == "api":
+        yielded = set()
+        try:
+            for job in iter_workday_api(url, known_links=known_links, stop_after=stop_after, high_water=high_water,
+                                        totals=totals):
+                yielded.add(job["link"])
+                yield job
+            return
+        except Exception as e:
+            logger.warning("Workday API failed for %s, falling back to selenium: %s", url, e)
+            metrics.incr("api_fallbacks")
+        # the pages read before the api failed have been yielded already
+        for job in scrape_workday_selenium(url):
+            if job["link"] not in yielded:
+                yield job
+        return
+    yield from scrape_workday_selenium(url)
+
+
+def scrape_workday_selenium(url):
+    count = 0
     try:
+        with get_pool().lease() as driver:
+            for job in read_job_pages(driver, url):
+                count += 1
+                yield job
+    except Exception as e:
+        # the pages read before the error have been yielded already, the caller decides what to
+        # keep and the company is still reported (and counted in errors) as failed
+        logger.error("Error scraping %s after %d jobs: %s", url, count, e)
+        if isinstance(e, TimeoutException):
+            metrics.incr("timeouts")
+        raise
+
+
+# scraped jobs have the location from the listing, which is "N Locations" for postings in
+# several places. this turns every job's location into a list, looking up the multi-location
+# ones in the cache first and resolving the rest from their detail pages. it's run after the
+# title filter and dedup so only jobs we might send cost a detail page
+def resolve_workday_locations(jobs, cache=None):
+    multiple = [job for job in jobs if "Locations" in job["location"]]
+    for job in jobs:
+        if "Locations" not in job["location"]:
+            job["location"] = [job["location"]]
+
+    if cache is not None and multiple:
+        cached = cache.cached_locations(multiple)
+        metrics.incr("location_cache_hits", len(cached))
+        for job in multiple:
+            if job["link"] in cached:
+                job["location"] = cached[job["link"]]
+        multiple = [job for job in multiple if job["link"] not in cached]
+
+    # postings from the api have a detail endpoint, the ones read by selenium need the browser
+    from_api = [job for job in multiple if job.get("detail_url")]
+    from_browser = [job for job in multiple if not job.get("detail_url")]
+    if from_api:
+        resolve_locations_api(from_api)
+    if from_browser:
+        resolve_locations_parallel(from_browser)  # Use the parallel location resolver
+    for job in multiple:
+        if isinstance(job["location"], str):
+            job["location"] = [job["location"]]
+
+    # a failed lookup falls back to ["N Locations"], only cache the ones that worked
+    if cache is not None:
+        cache.save_locations([job for job in multiple if not _unresolved(job)])
+    return jobs
+
+
+def _unresolved(job):
+    return len(job["location"]) == 1 and "Locations" in job["location"][0]
+
+
+# reads every page of job cards, yielding each page's jobs before moving on to the next.
+# selenium's webdriver package is slow to import, it's only loaded once a browser is used
+def read_job_pages(driver, url):
+    from selenium.webdriver.common.by import By
+
+    from company_scrapers.browser import wait_for, wait_until_removed
+
+    with metrics.timer("page_load"):
         driver.get(url)
-        wait = WebDriverWait(driver, 10)
         # wait until the job cards are loaded
-        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "ul[role='list']")))
-
-        # get the job cards
-        while True:
-            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "ul[role='list']")))
-            ul = driver.find_element(By.CSS_SELECTOR, "ul[role='list']")
-            job_cards = ul.find_elements(By.CSS_SELECTOR, ":scope > li")
-            for job_card in job_cards:
-                try:
-                    title_tag = job_card.find_element(By.CSS_SELECTOR, "a[data-automation-id='jobTitle']")
-                    title = title_tag.text
-                    link = title_tag.get_attribute("href")
-
-                    # check location
-                    location_tag = job_card.find_element(By.TAG_NAME, "dd")
-                    location = location_tag.text
-
-                    job_id_ul = job_card.find_element(By.CSS_SELECTOR, "ul[data-automation-id='subtitle']")
-                    job_id_tag = job_id_ul.find_element(By.TAG_NAME, "li")
-                    job_id = job_id_tag.text
-
-                    print(f"Title: {title}, location: {location}, job id: {job_id}")
-
-                    jobs.append({
-                        "title": title,
-                        "link": link,
-                        "location": location,
-                        "position_type": "N/A", # not provided on the job card, 
-                        "job_id": job_id
-                    })
-            
-                except Exception as e:
-                    print(f"Error with job: {e}")
-            
-            # check if on last page, if not then move on to next page and go up the loop
-            # if on last page, break out of the loop
-            num_job_text = driver.find_element(By.CSS_SELECTOR, "p[data-automation-id='jobOutOfText']").text
-            print(num_job_text)
-            cur_job_num = int(num_job_text.split(" ")[2])
-            total_jobs = int(num_job_text.split(" ")[4])
-            # print(f"Jobs seen: {cur_job_num}, Total jobs: {total_jobs}")
-            if cur_job_num == total_jobs:
-                print("Reached the last page.")
-                break
-            else:
-                pag = driver.find_element(By.CSS_SELECTOR, "nav[aria-label='pagination']")
-                next_button = pag.find_element(By.CSS_SELECTOR, "button[aria-label='next']")
+        wait_for(driver, "ul[role='list']")
+
+    # get the job cards
+    while True:
+        wait_for(driver, "ul[role='list']")
+        ul = driver.find_element(By.CSS_SELECTOR, "ul[role='list']")
+        job_cards = ul.find_elements(By.CSS_SELECTOR, ":scope > li")
+        metrics.incr("pages")
+        metrics.incr("cards", len(job_cards))
+        jobs = []
+        for job_card in job_cards:
+            try:
+                title_tag = job_card.find_element(By.CSS_SELECTOR, "a[data-automation-id='jobTitle']")
+                title = title_tag.text
+                # the same link the api engine builds for this posting
+                link = normalize_link(title_tag.get_attribute("href"))
+
+                # check location
+                location_tag = job_card.find_element(By.TAG_NAME, "dd")
+                location = location_tag.text
+
+                job_id_ul = job_card.find_element(By.CSS_SELECTOR, "ul[data-automation-id='subtitle']")
+                job_id_tag = job_id_ul.find_element(By.TAG_NAME, "li")
+                job_id = job_id_tag.text
+
+                logger.debug("Title: %s, location: %s, job id: %s", title, location, job_id)
+
+                jobs.append({
+                    "title": title,
+                    "link": link,
+                    "location": location,
+                    "position_type": "N/A", # not provided on the job card, 
+                    "job_id": job_id
+                })
+
+            except Exception as e:
+                logger.warning("Error with job: %s", e)
+        yield from jobs
+
+        # check if on last page, if not then move on to next page and go up the loop
+        # if on last page, break out of the loop
+        num_job_text = driver.find_element(By.CSS_SELECTOR, "p[data-automation-id='jobOutOfText']").text
+        logger.info(num_job_text)
+        cur_job_num = int(num_job_text.split(" ")[2])
+        total_jobs = int(num_job_text.split(" ")[4])
+        # print(f"Jobs seen: {cur_job_num}, Total jobs: {total_jobs}")
+        if cur_job_num == total_jobs:
+            logger.info("Reached the last page.")
+            break
+        else:
+            pag = driver.find_element(By.CSS_SELECTOR, "nav[aria-label='pagination']")
+            next_button = pag.find_element(By.CSS_SELECTOR, "button[aria-label='next']")
+            with metrics.timer("pagination"):
                 next_button.click()
                 # Wait for previous job cards to be stale so the next set of jobs can be loaded
-                wait.until(EC.staleness_of(job_cards[0]))  
-            
-    finally:
-        driver.quit()
-        jobs = resolve_locations_parallel(jobs)  # Use the parallel location resolver
-        return jobs
+                wait_until_removed(driver, job_cards[0])
     
 
 
-# from concurrent.futures import ProcessPoolExecutor, as_completed
-from concurrent.futures import ThreadPoolExecutor
+# retries for a detail page that fails to load, each one waits twice as long as the last
+RESOLVE_RETRIES = 2
+RESOLVE_BACKOFF = 2
+# roughly what a headless chrome with a workday page open uses
+CHROME_MEMORY = 300 * 1024 * 1024
 
-# resolve locations for jobs that have multiple locations
-def resolve_block(jobs):
-    options = Options()
-    options.add_argument("--headless")  # Run in headless mode after testing is complete
-    driver = webdriver.Chrome(options=options)
-    resolved = []
-    for job in jobs:
-        try:
-            driver.get(job["link"])
-            wait = WebDriverWait(driver, 10)
-            # wait until the job details are loaded
-            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "div[data-automation-id='job-posting-details']")))
-            # get locations
-            location_div = driver.find_element(By.CSS_SELECTOR, "div[data-automation-id='locations']")
-            locations_dl = location_div.find_element(By.TAG_NAME, "dl")
-            locations_tags = locations_dl.find_elements(By.TAG_NAME, "dd")
-            locations = [location.text for location in locations_tags]
-            print(f"Locations for {job['title']}: {locations}")
-            job["location"] = locations if locations else [job["location"]]
-        except Exception as e:
-            print(f"Error retrieving locations for job {job['title']}: {e}")
-            job["location"] = [job["location"]]  # Fallback to single location
-        
-        resolved.append(job)
 
-    driver.quit()
-    return resolved
+# reads the locations from a job's detail page, raises if the page doesn't load
+def read_locations(driver, link):
+    from selenium.webdriver.common.by import By
+
+    from company_scrapers.browser import wait_for
+
+    with metrics.timer("detail_load"):
+        driver.get(link)
+        # wait until the job details are loaded
+        wait_for(driver, "div[data-automation-id='job-posting-details']")
+    # get locations
+    location_div = driver.find_element(By.CSS_SELECTOR, "div[data-automation-id='locations']")
+    locations_dl = location_div.find_element(By.TAG_NAME, "dl")
+    locations_tags = locations_dl.find_elements(By.TAG_NAME, "dd")
+    return [location.text for location in locations_tags]
 
-def resolve_locations_parallel(jobs, max_workers=4):
-    resolved_jobs = []
 
-    # Split jobs into two groups
-    jobs_with_multiple_locations = [job for job in jobs if "Locations" in job["location"]]
-    jobs_with_single_location = [job for job in jobs if "Locations" not in job["location"]]
+def _available_memory():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
 
-    # Resolve jobs with multiple locations in parallel
-    blocks = [[] for _ in range(max_workers)] # a list of lists, size = max_workers, each list in the list has variable size, depending on the number of jobs, and they're evenly split
-    # split jobs to process into blocks
-    for i, job in enumerate(jobs_with_multiple_locations):
-        blocks[i % max_workers].append(job)
+# one browser per cpu, as long as there's memory for them, and never more than the pool has
+def default_resolve_workers():
+    workers = os.cpu_count() or 1
+    available = _available_memory()
+    if available is not None:
+        workers = min(workers, available // CHROME_MEMORY)
+    return max(1, min(workers, get_pool().size))
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(resolve_block, block) for block in blocks]
 
-        for future in futures:
+# resolve locations for jobs that have multiple locations. the jobs go into one shared queue
+# that every worker pulls from, so a slow page only holds up the worker that got it instead
+# of a whole block of jobs. a page that fails is put back with a delay and retried, and if
+# the browser itself died the worker gets a new one from the pool without losing any jobs
+def resolve_locations_parallel(jobs, max_workers=None):
+    if not jobs:
+        return jobs
+    max_workers = max_workers or default_resolve_workers()
+    max_workers = max(1, min(max_workers, len(jobs)))
+
+    # (ready at, order, attempt, job), ordered so retries wait for their backoff
+    work = queue.PriorityQueue()
+    for i, job in enumerate(jobs):
+        work.put((0, i, 0, job))
+    progress = {"done": 0, "total": len(jobs), "lock": threading.Lock(), "order": len(jobs)}
+
+    # the workers count their page loads towards the company that started them
+    company = current_company()
+    workers = [
+        threading.Thread(target=resolve_worker, args=(work, progress, company), daemon=True)
+        for _ in range(max_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # anything left means every worker gave up on its browser, keep the listing location
+    while not work.empty():
+        _, _, _, job = work.get_nowait()
+        job["location"] = [job["location"]]
+    return jobs
+
+
+def resolve_worker(work, progress, company=None):
+    with metrics.company(company):
+        _resolve_worker(work, progress)
+
+
+def _resolve_worker(work, progress):
+    pool = get_pool()
+    while not work.empty():
+        with ExitStack() as stack:
             try:
-                resolved_jobs.extend(future.result())
+                driver = stack.enter_context(pool.lease())
             except Exception as e:
-                print(f"Error resolving job locations: {e}")
-    
-    
-    for job in jobs_with_single_location:
-        job["location"] = [job["location"]]
-        resolved_jobs.append(job)
+                # starting chrome failed, let the other workers finish the queue
+                logger.error("Location worker couldn't get a browser: %s", e)
+                return
+            if not resolve_from_queue(driver, work, progress):
+                return
+
+
+# works through the queue with one browser. returns False once the queue is empty and True
+# if the browser crashed and the worker needs a new one
+def resolve_from_queue(driver, work, progress):
+    while True:
+        try:
+            ready_at, order, attempt, job = work.get_nowait()
+        except queue.Empty:
+            return False
+        delay = ready_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        crashed = False
+        try:
+            locations = read_locations(driver, job["link"])
+        except Exception as e:
+            if isinstance(e, TimeoutException):
+                metrics.incr("timeouts")
+            crashed = not get_pool().healthy(driver)
+            if attempt < RESOLVE_RETRIES:
+                # put it back behind the jobs that are ready now
+                delay = RESOLVE_BACKOFF * 2 ** attempt
+                with progress["lock"]:
+                    progress["order"] += 1
+                    order = progress["order"]
+                work.put((time.monotonic() + delay, order, attempt + 1, job))
+                metrics.incr("retries")
+                logger.info("Retrying locations for %s in %ss: %s", job["title"], delay, e)
+                if crashed:
+                    return True
+                continue
+            logger.warning("Error retrieving locations for job %s: %s", job["title"], e)
+            locations = []
 
-    return resolved_jobs
\ No newline at end of file
+        logger.debug("Locations for %s: %s", job["title"], locations)
+        job["location"] = locations if locations else [job["location"]]  # Fallback to single location
+        with progress["lock"]:
+            progress["done"] += 1
+            done, total = progress["done"], progress["total"]
+        if done % 10 == 0 or done == total:
+            logger.info("Resolved locations for %d of %d jobs", done, total)
+        if crashed:
+            return True
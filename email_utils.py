@@ -1,43 +1,144 @@
+import functools
+import json
+import logging
 import smtplib
+import time
 from email.mime.text import MIMEText
 
 from dotenv import load_dotenv
 import os
 
-from jinja2 import Environment, FileSystemLoader
+from job_store import MAX_SEND_ATTEMPTS
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
 # load credentials for the email that is sending the jobs
 EMAIL = os.getenv("EMAIL_ADDR")
 PASSWORD = os.getenv("EMAIL_PASSWORD")
+# gmail by default, point these at a local server to test without sending real email, e.g.
+# SMTP_HOST=localhost SMTP_PORT=8025 SMTP_SSL=false with python -m benchmarks.smtp_server
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+SMTP_SSL = os.getenv("SMTP_SSL", "true").lower() not in ("0", "false", "no")
 
+# attempts per message in one run, each waiting twice as long as the last
+SEND_RETRIES = 3
+SEND_BACKOFF = 1
+
+
+# the template is compiled the first time it's used and reused after that. jinja is only
+# imported then, runs with nothing to send don't need it
+@functools.lru_cache(maxsize=None)
+def _template(name="email_template.html"):
+    from jinja2 import Environment, FileSystemLoader
 
-def render_email_template(jobs):
     env = Environment(loader=FileSystemLoader("."))
-    template = env.get_template("email_template.html") # custom email template
-    return template.render(jobs=jobs, count=len(jobs))
+    return env.get_template(name) # custom email template
 
 
-def send_email(jobs, recipients):
-    email_content = render_email_template(jobs)
-    companies = set(job["company"] for job in jobs) # get the company names that have job postings
+def render_email_template(jobs):
+    return _template().render(jobs=jobs, count=len(jobs))
+
+
+# (subject, html) of the email for jobs
+def render_email(jobs):
+    with metrics.timer("email_render"):
+        email_content = render_email_template(jobs)
+    companies = sorted(set(job["company"] for job in jobs)) # get the company names that have job postings
     subject = f"New Job Postings from {', '.join(companies)}"
     # limit the number of characters in the title
     subject = subject[:100] + "..." if len(subject) > 100 else subject
+    return subject, email_content
+
 
-    # in case the user wants to email to multiple recipients
-    for recipient in recipients:
-        msg = MIMEText(email_content, "html")
+# one smtp session shared by every message in a run. it connects and logs in on the first
+# send and reconnects if the server drops the connection in between
+class Mailer:
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, ssl=SMTP_SSL, user=EMAIL, password=PASSWORD):
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self.user = user
+        self.password = password
+        self.server = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self):
+        server = smtplib.SMTP_SSL(self.host, self.port) if self.ssl else smtplib.SMTP(self.host, self.port)
+        if self.password:
+            server.login(self.user, self.password)
+        return server
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self.server = None
+
+    # sends one message to recipients, retrying with backoff. with more than one recipient
+    # they're all sent as bcc so nobody sees the others' addresses
+    def send(self, recipients, subject, html):
+        msg = MIMEText(html, "html")
         msg["Subject"] = subject
-        msg["From"] = EMAIL
-        msg["To"] = recipient
-        
-        try:
-            with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-                server.login(EMAIL, PASSWORD)
-                server.sendmail(EMAIL, recipient, msg.as_string())
-            print(f"Email sent successfully to {recipient}.")
-        except Exception as e:
-            print(f"Failed to send email: {e}")
-            raise e
+        msg["From"] = self.user
+        msg["To"] = recipients[0] if len(recipients) == 1 else self.user
+        for attempt in range(SEND_RETRIES):
+            try:
+                if self.server is None:
+                    self.server = self._connect()
+                with metrics.timer("email_send"):
+                    self.server.sendmail(self.user, recipients, msg.as_string())
+                return
+            except (smtplib.SMTPException, OSError) as e:
+                # a refused recipient won't be accepted on the next try either
+                if isinstance(e, smtplib.SMTPRecipientsRefused) or attempt == SEND_RETRIES - 1:
+                    raise
+                logger.warning("Sending to %s failed, retrying: %s", ", ".join(recipients), e)
+                metrics.incr("email_retries")
+                # smtplib resets the session after a refused message, only a dropped one needs a new connection
+                if not isinstance(e, smtplib.SMTPResponseException):
+                    self.close()
+                time.sleep(SEND_BACKOFF * 2 ** attempt)
+
+
+# sends everything waiting in the store's outbox that owner could claim. a message that fails
+# stays in the outbox for the next run until it has failed MAX_SEND_ATTEMPTS times, one that was
+# sent is never sent again
+def deliver_outbox(store, owner, mailer=None):
+    messages = store.claim_outbox(owner)
+    if not messages:
+        return 0
+    sent = 0
+    with mailer or Mailer() as mailer:
+        for message in messages:
+            recipients = json.loads(message["recipients"])
+            try:
+                mailer.send(recipients, message["subject"], message["body"])
+            except Exception as e:
+                metrics.incr("email_failures")
+                store.outbox_failed(message["id"], str(e))
+                if message["attempts"] + 1 >= MAX_SEND_ATTEMPTS:
+                    logger.error("Failed to send email to %s %d times, giving up on it (outbox id %d): %s",
+                                 ", ".join(recipients), MAX_SEND_ATTEMPTS, message["id"], e)
+                    metrics.incr("emails_abandoned")
+                else:
+                    logger.error("Failed to send email to %s, it will be retried next run: %s",
+                                 ", ".join(recipients), e)
+                continue
+            store.outbox_sent(message["id"])
+            logger.info("Email sent successfully to %s.", ", ".join(recipients))
+            sent += 1
+    return sent
+
@@ -0,0 +1,161 @@
+# on-disk cache for the http requests the scrapers make. responses are keyed by method, url
+# and request body and kept for a ttl that depends on what they are (listing pages change
+# during the day, a job's detail page hardly ever does). once the ttl is up the next request
+# sends the etag/last-modified we got back so an unchanged response costs a 304 instead of a
+# download. the cache is bounded in size and evicts the least recently used responses first
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = "fetch_cache.db"
+
+# seconds a response is used without asking the server again
+DEFAULT_TTLS = {
+    "listing": 10 * 60,
+    "detail": 7 * 24 * 60 * 60,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    resource_type TEXT NOT NULL,
+    body BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+"""
+
+
+def cache_key(method, url, body=None):
+    digest = hashlib.sha256(f"{method} {url}\n".encode())
+    if body:
+        digest.update(body)
+    return digest.hexdigest()
+
+
+class FetchCache:
+    def __init__(self, path=CACHE_FILE, max_bytes=200 * 1024 * 1024, ttls=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "evictions": 0}
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+            self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+        metrics.incr(f"fetch_cache_{stat}")
+
+    # returns (status, body). send(headers) makes the request with the extra headers and
+    # returns (status, response headers, body), it's only called when the cached response is
+    # missing or too old
+    def fetch(self, method, url, body, resource_type, send):
+        cached, headers = self.lookup(method, url, body, resource_type)
+        if cached is not None:
+            return 200, cached
+        status, response_headers, data = send(headers)
+        return self.update(method, url, body, resource_type, status, response_headers, data)
+
+    # the first half of fetch for callers that make the request themselves (workday_async).
+    # returns (body, None) if the cached response is fresh, otherwise (None, headers) with the
+    # conditional headers to send
+    def lookup(self, method, url, body, resource_type):
+        key = cache_key(method, url, body)
+        now = time.time()
+        with self.lock:
+            entry = self.conn.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if entry is not None and now - entry[3] < self.ttls.get(resource_type, 0):
+            self._touch(key, now)
+            self._count("hits")
+            return entry[0], None
+
+        headers = {}
+        if entry is not None:
+            if entry[1]:
+                headers["If-None-Match"] = entry[1]
+            if entry[2]:
+                headers["If-Modified-Since"] = entry[2]
+        return None, headers
+
+    # the second half: stores a 200 response, or turns a 304 into the cached body.
+    # returns (status, body)
+    def update(self, method, url, body, resource_type, status, response_headers, data):
+        key = cache_key(method, url, body)
+        now = time.time()
+        if status == 304:
+            with self.lock, self.conn:
+                entry = self.conn.execute("SELECT body FROM responses WHERE key = ?", (key,)).fetchone()
+                if entry is not None:
+                    self.conn.execute(
+                        "UPDATE responses SET fetched_at = ?, last_access = ? WHERE key = ?", (now, now, key)
+                    )
+            if entry is not None:
+                self._count("revalidated")
+                return 200, entry[0]
+
+        self._count("misses")
+        if status == 200:
+            self._store(key, url, resource_type, data, response_headers, now)
+        return status, data
+
+    def _touch(self, key, now):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+
+    def _store(self, key, url, resource_type, data, response_headers, now):
+        with self.lock, self.conn:
+            old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                """INSERT OR REPLACE INTO responses
+                (key, url, resource_type, body, etag, last_modified, fetched_at, last_access, size)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (key, url, resource_type, data, response_headers.get("ETag"),
+                 response_headers.get("Last-Modified"), now, now, len(data)),
+            )
+            self.total_bytes += len(data) - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    # drops the least recently used responses until the cache is back under 90% of its limit
+    def _evict(self):
+        target = self.max_bytes * 0.9
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY last_access")
+        evicted = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append(key)
+            self.total_bytes -= size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key in evicted])
+        self.stats["evictions"] += len(evicted)
+        metrics.incr("fetch_cache_evictions", len(evicted))
+
+    def log_stats(self):
+        logger.info(
+            "Fetch cache: %d hits, %d revalidated, %d misses, %d evicted, %.1f MB on disk",
+            self.stats["hits"], self.stats["revalidated"], self.stats["misses"], self.stats["evictions"],
+            self.total_bytes / 1024 / 1024,
+        )
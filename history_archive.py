@@ -0,0 +1,142 @@
+# columnar archive of old sent jobs, kept as parquet files in a directory next to jobs.db.
+# sent_jobs only needs the recent rows for claims and emails, everything older than a few weeks
+# is only ever read to dedup, so it's moved here (see JobStore.archive_sent) where it takes a
+# fraction of the space: company and locations are dictionary encoded, the files are zstd
+# compressed, and rows are sorted by company and link so each row group's min/max statistics
+# let a lookup skip the row groups of the other companies without reading them. reads only
+# decode the columns they ask for, and company comes back as a pandas categorical instead of a
+# python string per row. every archive_sent writes a new file, once there are more than
+# max_files they're compacted into one with the duplicates dropped
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = "history"
+
+SCHEMA = pa.schema([
+    ("company", pa.dictionary(pa.int32(), pa.string())),
+    ("title", pa.string()),
+    ("link", pa.string()),
+    ("location", pa.list_(pa.dictionary(pa.int32(), pa.string()))),
+    ("job_id", pa.string()),
+    ("added_date", pa.timestamp("s")),
+])
+
+# rows per row group, the unit a company filter can skip
+ROW_GROUP_SIZE = 10_000
+
+
+def _locations(value):
+    if not value:
+        return []
+    locations = json.loads(value)
+    return locations if isinstance(locations, list) else [str(locations)]
+
+
+class HistoryArchive:
+    def __init__(self, path=ARCHIVE_DIR, max_files=8):
+        self.path = path
+        self.max_files = max_files
+        os.makedirs(path, exist_ok=True)
+        # the dataset lists the files once, it's rebuilt after a write or compaction
+        self.lock = threading.Lock()
+        self._dataset = None
+
+    def files(self):
+        return sorted(glob.glob(os.path.join(self.path, "*.parquet")))
+
+    def dataset(self):
+        with self.lock:
+            if self._dataset is None:
+                self._dataset = ds.dataset(self.files(), schema=SCHEMA, format="parquet")
+            return self._dataset
+
+    def _write(self, table):
+        # arrow can't sort dictionary columns, so company is sorted as plain strings and encoded after.
+        # the file is written under a temporary name and renamed so readers never see half of it
+        table = table.set_column(0, "company", table["company"].cast(pa.string()))
+        table = table.sort_by([("company", "ascending"), ("link", "ascending")]).cast(SCHEMA)
+        name = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+        tmp = os.path.join(self.path, f".{name}.tmp")
+        pq.write_table(table, tmp, row_group_size=ROW_GROUP_SIZE, compression="zstd")
+        os.replace(tmp, os.path.join(self.path, name))
+        with self.lock:
+            self._dataset = None
+        return os.path.join(self.path, name)
+
+    # rows are (company, title, link, location json, job_id, added_date) as stored in sent_jobs
+    def append(self, rows):
+        if not rows:
+            return
+        companies, titles, links, locations, job_ids, dates = zip(*rows)
+        table = pa.table({
+            "company": pa.array(companies, pa.string()),
+            "title": pa.array(titles, pa.string()),
+            "link": pa.array(links, pa.string()),
+            "location": pa.array([_locations(value) for value in locations], pa.list_(pa.string())),
+            "job_id": pa.array(job_ids, pa.string()),
+            "added_date": pa.array(
+                [datetime.strptime(date, "%Y-%m-%d %H:%M:%S") if date else None for date in dates], pa.timestamp("s")),
+        })
+        self._write(table)
+        logger.info("Archived %d sent jobs to %s.", len(rows), self.path)
+        if len(self.files()) > self.max_files:
+            self.compact()
+
+    # link -> title of the given links archived for this company, the newest one if a link was
+    # archived more than once
+    def sent_titles(self, company, links):
+        links = list(set(links))
+        if not links or not self.files():
+            return {}
+        with metrics.timer("archive_lookup"):
+            table = self.dataset().to_table(
+                columns=["link", "title", "added_date"],
+                filter=(pc.field("company") == company) & pc.field("link").isin(links),
+            )
+        titles = {}
+        newest = {}
+        for link, title, added in zip(*(table[name].to_pylist() for name in ("link", "title", "added_date"))):
+            if link not in newest or (added and (newest[link] is None or added > newest[link])):
+                titles[link] = title
+                newest[link] = added
+        return titles
+
+    # the archived jobs as a pandas dataframe, only reading the given columns and companies
+    def load(self, companies=None, columns=None):
+        if not self.files():
+            return SCHEMA.empty_table().select(columns or SCHEMA.names).to_pandas()
+        flt = pc.field("company").isin(list(companies)) if companies is not None else None
+        return self.dataset().to_table(columns=columns, filter=flt).to_pandas()
+
+    # merges every file into one, keeping the newest row of each (company, link). the new file
+    # is in place before the old ones are removed, so a crash in between only leaves duplicates
+    def compact(self):
+        files = self.files()
+        if len(files) < 2:
+            return
+        with metrics.timer("archive_compact"):
+            table = ds.dataset(files, schema=SCHEMA, format="parquet").to_table()
+            table = table.sort_by([("added_date", "ascending")])
+            table = table.append_column("row", pa.array(range(len(table)), pa.int64()))
+            newest = table.group_by(["company", "link"]).aggregate([("row", "max")])["row_max"]
+            table = table.take(newest).drop_columns(["row"])
+            self._write(table)
+            for path in files:
+                os.remove(path)
+            with self.lock:
+                self._dataset = None
+        logger.info("Compacted %d archive files into one with %d jobs.", len(files), len(table))
@@ -0,0 +1,642 @@
+# sqlite database of the jobs we've sent and every posting we've scraped. lookups only touch
+# the rows for the links being checked (through the indexes) so checking a company's postings
+# costs the same whether the history has a hundred rows or a few hundred thousand, and nothing
+# is loaded into memory up front the way the csv was. new jobs are saved as soon as their
+# company is done, as pending until the email goes out, and the companies finished in a run
+# are checkpointed so an interrupted run can pick up where it left off. the shards of a sharded
+# run (see main.py) share one database, sqlite's locking keeps their writes apart. how often
+# each company posts, how long it takes and how often it fails are kept for the scheduler, and
+# emails wait in an outbox until they've been sent. sent jobs older than a few weeks can be
+# moved to a columnar archive (history_archive.py) so the table stays small
+import csv
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+DB_FILE = "jobs.db"
+
+# sqlite limits how many parameters a query can have, so big lookups are split up
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sent_jobs (
+    company TEXT NOT NULL,
+    title TEXT NOT NULL,
+    link TEXT NOT NULL,
+    location TEXT,
+    job_id TEXT,
+    added_date TEXT,
+    emailed INTEGER NOT NULL DEFAULT 1,
+    claimed_by TEXT,
+    claimed_at TEXT,
+    PRIMARY KEY (company, link)
+);
+CREATE INDEX IF NOT EXISTS sent_jobs_job_id ON sent_jobs (job_id);
+
+CREATE TABLE IF NOT EXISTS seen_jobs (
+    company TEXT NOT NULL,
+    link TEXT NOT NULL,
+    first_seen TEXT,
+    last_seen TEXT,
+    PRIMARY KEY (company, link)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS high_water (
+    company TEXT PRIMARY KEY,
+    link TEXT NOT NULL,
+    updated TEXT
+);
+
+CREATE TABLE IF NOT EXISTS seen_filters (
+    company TEXT PRIMARY KEY,
+    filters TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS job_locations (
+    company TEXT NOT NULL,
+    link TEXT NOT NULL,
+    job_id TEXT,
+    location TEXT NOT NULL,
+    updated TEXT,
+    PRIMARY KEY (company, link)
+);
+CREATE INDEX IF NOT EXISTS job_locations_job_id ON job_locations (company, job_id);
+
+CREATE TABLE IF NOT EXISTS unresolved_jobs (
+    company TEXT NOT NULL,
+    link TEXT NOT NULL,
+    job TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    updated TEXT,
+    PRIMARY KEY (company, link)
+);
+
+-- the (company, link) of every job archive_sent moved to the archive, so a lookup only reads
+-- the archive for links that are in it
+CREATE TABLE IF NOT EXISTS archived_links (
+    company TEXT NOT NULL,
+    link TEXT NOT NULL,
+    PRIMARY KEY (company, link)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS run_state (
+    company TEXT PRIMARY KEY,
+    finished TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS company_stats (
+    company TEXT PRIMARY KEY,
+    runs INTEGER NOT NULL,
+    last_scraped TEXT,
+    new_per_hour REAL,
+    duration REAL,
+    error_rate REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    recipients TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    created TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    claimed_by TEXT,
+    claimed_at TEXT,
+    sent_at TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_unsent ON outbox (id) WHERE sent_at IS NULL;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+# an outbox message that has failed this many times is left alone (deliver_outbox logs an error
+# when it gives up on one)
+MAX_SEND_ATTEMPTS = 10
+
+# runs a job's locations are looked up in before it's given up on, see save_unresolved
+MAX_LOCATION_ATTEMPTS = 5
+
+# columns added to sent_jobs after it was first created
+NEW_COLUMNS = {
+    "emailed": "INTEGER NOT NULL DEFAULT 1",
+    "claimed_by": "TEXT",
+    "claimed_at": "TEXT",
+}
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _batches(items, size=BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class JobStore:
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        # scrapers run on several threads, they share the connection through the lock. other
+        # processes (shards) may be writing too, so wait for their transactions instead of failing
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        # history_archive.HistoryArchive holding the sent jobs moved out by archive_sent, if any
+        self.archive = None
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+            # databases from before jobs were saved as pending and claimed for sending. shards
+            # open the database at the same time, so the columns are checked again once this
+            # process holds the write lock
+            with self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                columns = {row[1] for row in self.conn.execute("PRAGMA table_info(sent_jobs)")}
+                for column, definition in NEW_COLUMNS.items():
+                    if column not in columns:
+                        self.conn.execute(f"ALTER TABLE sent_jobs ADD COLUMN {column} {definition}")
+                self.conn.execute("CREATE INDEX IF NOT EXISTS sent_jobs_pending ON sent_jobs (emailed) WHERE emailed = 0")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    # link -> title of the given links that have already been sent for this company. the archive
+    # is only read for the links archived_links says are in it
+    def sent_titles(self, company, links):
+        titles = {}
+        archived = set()
+        with self.lock:
+            for batch in _batches(set(links)):
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT link, title FROM sent_jobs WHERE company = ? AND link IN ({placeholders})",
+                    [company, *batch],
+                )
+                titles.update(rows)
+            if self.archive is not None:
+                for batch in _batches(set(links) - titles.keys()):
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self.conn.execute(
+                        f"SELECT link FROM archived_links WHERE company = ? AND link IN ({placeholders})",
+                        [company, *batch],
+                    )
+                    archived.update(link for (link,) in rows)
+        if archived:
+            titles.update(self.archive.sent_titles(company, archived))
+        return titles
+
+    # returns the jobs that haven't been sent yet. some job titles have the same name so the
+    # link is what identifies a posting, but a link that comes back with a different title is
+    # treated as a new posting
+    def filter_unsent(self, jobs, company):
+        sent = self.sent_titles(company, [job.get("link", "") for job in jobs])
+        filtered_jobs = []
+        for job in jobs:
+            title = job.get("title")
+            prev_title = sent.get(job.get("link", ""))
+            if prev_title is not None and title.lower() == prev_title.lower():
+                logger.debug("Skipping %s because it has already been sent.", title)
+                continue
+            filtered_jobs.append(job)
+        return filtered_jobs
+
+    # jobs are saved with emailed=False as soon as they're found and marked emailed once the
+    # email has gone out, so a crash in between leaves them pending for the next run
+    def save_sent(self, jobs, emailed=True):
+        rows = [
+            (job["company"], job["title"], job["link"], json.dumps(job["location"]), job.get("job_id"), _now(),
+             int(emailed))
+            for job in jobs
+        ]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                """INSERT INTO sent_jobs (company, title, link, location, job_id, added_date, emailed)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (company, link) DO UPDATE SET
+                    title = excluded.title,
+                    location = excluded.location,
+                    job_id = excluded.job_id,
+                    added_date = excluded.added_date,
+                    emailed = excluded.emailed,
+                    claimed_by = NULL,
+                    claimed_at = NULL""",
+                rows,
+            )
+
+    # claims every pending job for owner and returns them, oldest first. the claim is a single
+    # update so when several shards finish at once each pending job goes to exactly one of them
+    # and is only emailed once. a claim older than stale_after seconds belongs to a process that
+    # died before sending, so it can be taken over
+    def claim_pending(self, owner, stale_after=3600):
+        now = datetime.now()
+        cutoff = (now - timedelta(seconds=stale_after)).strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock, self.conn:
+            self.conn.execute(
+                """UPDATE sent_jobs SET claimed_by = ?, claimed_at = ?
+                WHERE emailed = 0 AND (claimed_by IS NULL OR claimed_at < ?)""",
+                (owner, now.strftime("%Y-%m-%d %H:%M:%S"), cutoff),
+            )
+            rows = self.conn.execute(
+                """SELECT company, title, link, location, job_id FROM sent_jobs
+                WHERE emailed = 0 AND claimed_by = ? ORDER BY added_date, rowid""",
+                (owner,),
+            ).fetchall()
+        return [
+            {"company": company, "title": title, "link": link, "location": json.loads(location), "job_id": job_id}
+            for company, title, link, location, job_id in rows
+        ]
+
+    # gives back the jobs owner claimed but couldn't send so the next run can
+    def release_claim(self, owner):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE sent_jobs SET claimed_by = NULL, claimed_at = NULL WHERE emailed = 0 AND claimed_by = ?",
+                (owner,),
+            )
+
+    # puts the emails for jobs in the outbox and marks the jobs emailed in one transaction, so
+    # a job is either still pending or in an email that will be sent, never both or neither.
+    # messages is a list of (recipients, subject, html)
+    def queue_email(self, jobs, messages):
+        now = _now()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO outbox (recipients, subject, body, created) VALUES (?, ?, ?, ?)",
+                [(json.dumps(recipients), subject, body, now) for recipients, subject, body in messages],
+            )
+            self.conn.executemany(
+                "UPDATE sent_jobs SET emailed = 1 WHERE company = ? AND link = ?",
+                [(job["company"], job["link"]) for job in jobs],
+            )
+            self.conn.execute(
+                """INSERT INTO meta (key, value) VALUES ('last_email', ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value""",
+                (now,),
+            )
+
+    # claims the unsent outbox messages for owner, the same way as claim_pending
+    def claim_outbox(self, owner, stale_after=3600):
+        now = datetime.now()
+        cutoff = (now - timedelta(seconds=stale_after)).strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock, self.conn:
+            self.conn.execute(
+                """UPDATE outbox SET claimed_by = ?, claimed_at = ?
+                WHERE sent_at IS NULL AND attempts < ? AND (claimed_by IS NULL OR claimed_at < ?)""",
+                (owner, now.strftime("%Y-%m-%d %H:%M:%S"), MAX_SEND_ATTEMPTS, cutoff),
+            )
+            rows = self.conn.execute(
+                """SELECT id, recipients, subject, body, attempts FROM outbox
+                WHERE sent_at IS NULL AND claimed_by = ? ORDER BY id""",
+                (owner,),
+            ).fetchall()
+        return [
+            {"id": id, "recipients": recipients, "subject": subject, "body": body, "attempts": attempts}
+            for id, recipients, subject, body, attempts in rows
+        ]
+
+    def outbox_sent(self, message_id):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE outbox SET sent_at = ? WHERE id = ?", (_now(), message_id))
+
+    def outbox_failed(self, message_id, error):
+        with self.lock, self.conn:
+            self.conn.execute(
+                """UPDATE outbox SET attempts = attempts + 1, last_error = ?, claimed_by = NULL, claimed_at = NULL
+                WHERE id = ?""",
+                (error, message_id),
+            )
+
+    def last_email(self):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'last_email'").fetchone()
+        return datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S") if row else None
+
+    # moves the jobs that were emailed more than days ago to the archive. the archive is written
+    # first and a row is only deleted if it hasn't been sent again since it was read, so a crash
+    # or another shard writing in between can leave a job in both places but never in neither
+    def archive_sent(self, days):
+        cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock:
+            rows = self.conn.execute(
+                """SELECT company, title, link, location, job_id, added_date FROM sent_jobs
+                WHERE emailed = 1 AND added_date < ?""",
+                (cutoff,),
+            ).fetchall()
+        if not rows:
+            return 0
+        self.archive.append(rows)
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO archived_links (company, link) VALUES (?, ?)",
+                [(company, link) for company, _, link, _, _, _ in rows],
+            )
+            self.conn.executemany(
+                "DELETE FROM sent_jobs WHERE company = ? AND link = ? AND added_date = ? AND emailed = 1",
+                [(company, link, added_date) for company, _, link, _, _, added_date in rows],
+            )
+        return len(rows)
+
+    # how many jobs have been moved to the archive
+    def archived_count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM archived_links").fetchone()[0]
+
+    # archives written before archived_links existed have their links added to it once, otherwise
+    # the lookups would never read them
+    def index_archive(self):
+        if self.archived_count() or not self.archive.files():
+            return
+        frame = self.archive.load(columns=["company", "link"])
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO archived_links (company, link) VALUES (?, ?)",
+                zip(frame["company"].astype(str), frame["link"]),
+            )
+        logger.info("Indexed %d archived jobs.", len(frame))
+
+    # every link scraped or sent for a company, used by incremental scraping
+    def known_links(self, company):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT link FROM seen_jobs WHERE company = ? UNION SELECT link FROM sent_jobs WHERE company = ?",
+                (company, company),
+            )
+            return {link for (link,) in rows}
+
+    def high_water(self, company):
+        with self.lock:
+            row = self.conn.execute("SELECT link FROM high_water WHERE company = ?", (company,)).fetchone()
+        return row[0] if row else None
+
+    # the fingerprint of the title and location filters (JobMatcher.fingerprint) the company's
+    # postings were last marked seen with, or None. a posting is marked seen whether or not it
+    # matched, so once the filters change the seen postings can't be skipped until the company
+    # has been read in full with the new ones
+    def seen_filters(self, company):
+        with self.lock:
+            row = self.conn.execute("SELECT filters FROM seen_filters WHERE company = ?", (company,)).fetchone()
+        return row[0] if row else None
+
+    # returns how many of the links hadn't been seen before
+    def mark_seen(self, company, links, high_water=None, filters=None):
+        with self.lock, self.conn:
+            return self._mark_seen(company, links, high_water, filters)
+
+    def _mark_seen(self, company, links, high_water=None, filters=None):
+        now = _now()
+        links = set(links)
+        seen = 0
+        for batch in _batches(links):
+            placeholders = ",".join("?" * len(batch))
+            seen += self.conn.execute(
+                f"SELECT COUNT(*) FROM seen_jobs WHERE company = ? AND link IN ({placeholders})",
+                [company, *batch],
+            ).fetchone()[0]
+        self.conn.executemany(
+            """INSERT INTO seen_jobs (company, link, first_seen, last_seen) VALUES (?, ?, ?, ?)
+            ON CONFLICT (company, link) DO UPDATE SET last_seen = excluded.last_seen""",
+            [(company, link, now, now) for link in links],
+        )
+        if high_water:
+            self.conn.execute(
+                """INSERT INTO high_water (company, link, updated) VALUES (?, ?, ?)
+                ON CONFLICT (company) DO UPDATE SET link = excluded.link, updated = excluded.updated""",
+                (company, high_water, now),
+            )
+        if filters:
+            self.conn.execute(
+                """INSERT INTO seen_filters (company, filters) VALUES (?, ?)
+                ON CONFLICT (company) DO UPDATE SET filters = excluded.filters""",
+                (company, filters),
+            )
+        return len(links) - seen
+
+    # company -> {"runs", "last_scraped" (datetime or None), "new_per_hour" (None until the
+    # company has been scraped twice), "duration", "error_rate"}
+    def company_stats(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT company, runs, last_scraped, new_per_hour, duration, error_rate FROM company_stats"
+            ).fetchall()
+        return {
+            company: {
+                "runs": runs,
+                "last_scraped": datetime.strptime(last_scraped, "%Y-%m-%d %H:%M:%S") if last_scraped else None,
+                "new_per_hour": new_per_hour,
+                "duration": duration,
+                "error_rate": error_rate,
+            }
+            for company, runs, last_scraped, new_per_hour, duration, error_rate in rows
+        }
+
+    # folds one run of a company into its stats, as moving averages weighted by alpha towards
+    # the latest run. new_postings is how many postings hadn't been seen before, turned into a
+    # rate over the hours since the last successful scrape. a failed run only counts towards
+    # the duration and error rate, the company stays due until it's scraped successfully.
+    # started is when the run began and is saved as last_scraped, so the next run compares its
+    # own start against this one's no matter how far into the run the company finished
+    def record_company_run(self, company, status, duration, new_postings=0, alpha=0.3, started=None):
+        now = started or datetime.now()
+        ok = status == "ok"
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT runs, last_scraped, new_per_hour, duration, error_rate FROM company_stats WHERE company = ?",
+                (company,),
+            ).fetchone()
+            if row is None:
+                runs, last_scraped, rate, avg_duration, error_rate = 0, None, None, duration, 0.0 if ok else 1.0
+            else:
+                runs, last_scraped, rate, avg_duration, error_rate = row
+                avg_duration = alpha * duration + (1 - alpha) * avg_duration
+                error_rate = alpha * (0.0 if ok else 1.0) + (1 - alpha) * error_rate
+
+            if ok:
+                if last_scraped:
+                    # at least a minute so back to back runs don't make a huge rate
+                    hours = max((now - datetime.strptime(last_scraped, "%Y-%m-%d %H:%M:%S")).total_seconds() / 3600, 1 / 60)
+                    sample = new_postings / hours
+                    rate = sample if rate is None else alpha * sample + (1 - alpha) * rate
+                last_scraped = now.strftime("%Y-%m-%d %H:%M:%S")
+
+            self.conn.execute(
+                """INSERT INTO company_stats (company, runs, last_scraped, new_per_hour, duration, error_rate)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (company) DO UPDATE SET
+                    runs = excluded.runs,
+                    last_scraped = excluded.last_scraped,
+                    new_per_hour = excluded.new_per_hour,
+                    duration = excluded.duration,
+                    error_rate = excluded.error_rate""",
+                (company, runs + 1, last_scraped, rate, avg_duration, error_rate),
+            )
+
+    # link -> locations of the given jobs that were resolved in an earlier run. a job whose link
+    # changed is still found by its job id
+    def cached_locations(self, jobs):
+        found = {}
+        with self.lock:
+            for company in {job["company"] for job in jobs}:
+                company_jobs = [job for job in jobs if job["company"] == company]
+                by_link = {}
+                for batch in _batches({job["link"] for job in company_jobs}):
+                    placeholders = ",".join("?" * len(batch))
+                    by_link.update(self.conn.execute(
+                        f"SELECT link, location FROM job_locations WHERE company = ? AND link IN ({placeholders})",
+                        [company, *batch],
+                    ))
+                by_job_id = {}
+                for batch in _batches({job["job_id"] for job in company_jobs if job.get("job_id")}):
+                    placeholders = ",".join("?" * len(batch))
+                    by_job_id.update(self.conn.execute(
+                        f"SELECT job_id, location FROM job_locations WHERE company = ? AND job_id IN ({placeholders})",
+                        [company, *batch],
+                    ))
+                for job in company_jobs:
+                    location = by_link.get(job["link"]) or by_job_id.get(job.get("job_id"))
+                    if location is not None:
+                        found[job["link"]] = json.loads(location)
+        return found
+
+    def save_locations(self, jobs):
+        now = _now()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                """INSERT INTO job_locations (company, link, job_id, location, updated) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (company, link) DO UPDATE SET
+                    job_id = excluded.job_id,
+                    location = excluded.location,
+                    updated = excluded.updated""",
+                [(job["company"], job["link"], job.get("job_id"), json.dumps(job["location"]), now) for job in jobs],
+            )
+
+    # the company's jobs whose locations couldn't be looked up in an earlier run, as they were
+    # scraped ("N Locations" and all)
+    def unresolved_jobs(self, company):
+        with self.lock:
+            rows = self.conn.execute("SELECT job FROM unresolved_jobs WHERE company = ?", (company,)).fetchall()
+        return [json.loads(job) for (job,) in rows]
+
+    # replaces the company's unresolved jobs with jobs, the ones a lookup failed for this run. the
+    # lookups are retried every run (the postings have been marked seen, so an incremental scrape
+    # might not come back to them) until one works or they've failed MAX_LOCATION_ATTEMPTS times
+    def save_unresolved(self, company, jobs):
+        now = _now()
+        with self.lock, self.conn:
+            attempts = dict(self.conn.execute(
+                "SELECT link, attempts FROM unresolved_jobs WHERE company = ?", (company,)).fetchall())
+            self.conn.execute("DELETE FROM unresolved_jobs WHERE company = ?", (company,))
+            rows = []
+            for job in jobs:
+                tries = attempts.get(job["link"], 0) + 1
+                if tries >= MAX_LOCATION_ATTEMPTS:
+                    logger.error("Giving up on the locations of %s (%s) after %d runs.", job["title"], job["link"], tries)
+                    continue
+                location = job["location"][0] if isinstance(job["location"], list) else job["location"]
+                rows.append((company, job["link"], json.dumps({**job, "location": location}), tries, now))
+            self.conn.executemany(
+                "INSERT INTO unresolved_jobs (company, link, job, attempts, updated) VALUES (?, ?, ?, ?, ?)", rows)
+
+    # starts a run of companies and returns the ones that can be skipped: the ones an interrupted
+    # run finished, if it started less than max_age hours ago. a run that got to the end has no
+    # checkpoint left so the next one starts from scratch. scope keeps the checkpoints of
+    # different shards apart
+    def start_run(self, companies, max_age=12, scope=None):
+        key = "run_started" if scope is None else f"run_started {scope}"
+        companies = list(companies)
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                started = datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S")
+                if (datetime.now() - started).total_seconds() < max_age * 3600:
+                    finished = set()
+                    for batch in _batches(companies):
+                        placeholders = ",".join("?" * len(batch))
+                        finished.update(company for (company,) in self.conn.execute(
+                            f"SELECT company FROM run_state WHERE company IN ({placeholders})", batch))
+                    logger.info("Resuming the run from %s, %d companies already done.", row[0], len(finished))
+                    return finished
+            self._clear_run_state(companies)
+            self.conn.execute(
+                """INSERT INTO meta (key, value) VALUES (?, ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value""",
+                (key, _now()),
+            )
+        return set()
+
+    def finish_company(self, company):
+        with self.lock, self.conn:
+            self.conn.execute(
+                """INSERT INTO run_state (company, finished) VALUES (?, ?)
+                ON CONFLICT (company) DO UPDATE SET finished = excluded.finished""",
+                (company, _now()),
+            )
+
+    def finish_run(self, companies, scope=None):
+        key = "run_started" if scope is None else f"run_started {scope}"
+        with self.lock, self.conn:
+            self._clear_run_state(list(companies))
+            self.conn.execute("DELETE FROM meta WHERE key = ?", (key,))
+
+    def _clear_run_state(self, companies):
+        for batch in _batches(companies):
+            placeholders = ",".join("?" * len(batch))
+            self.conn.execute(f"DELETE FROM run_state WHERE company IN ({placeholders})", batch)
+
+    # one-shot import of the sent_jobs.csv and seen_jobs.json history from before the database.
+    # it's recorded in the meta table so the files are only read the first time. the files are
+    # read first, then the import runs in one write transaction that checks the marker again,
+    # so processes migrating at the same time import the history once and none of them fail.
+    # links are normalized the way the scrapers normalize them, so the history written by the
+    # selenium scraper (with /en-US/ in the workday links) matches what the api engine reads
+    def migrate(self, csv_path="sent_jobs.csv", seen_path="seen_jobs.json"):
+        if self._migrated():
+            return
+        from company_scrapers.workday_api import normalize_link
+
+        rows = []
+        if os.path.exists(csv_path):
+            with open(csv_path, newline="") as f:
+                for row in csv.DictReader(f):
+                    rows.append((row["company"], row["title"], normalize_link(row["link"]), row["location"],
+                                 row.get("job_id") or None, row.get("added_date") or _now()))
+        seen = {}
+        if os.path.exists(seen_path):
+            with open(seen_path, "r") as f:
+                seen = json.load(f)
+        for entry in seen.values():
+            entry["links"] = [normalize_link(link) for link in entry.get("links", [])]
+            if entry.get("high_water"):
+                entry["high_water"] = normalize_link(entry["high_water"])
+
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            if self.conn.execute("SELECT value FROM meta WHERE key = 'migrated'").fetchone():
+                return
+            self.conn.executemany(
+                """INSERT INTO sent_jobs (company, title, link, location, job_id, added_date)
+                VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (company, link) DO NOTHING""",
+                rows,
+            )
+            for company, entry in seen.items():
+                self._mark_seen(company, entry.get("links", []), entry.get("high_water"))
+            self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('migrated', ?)", (_now(),))
+        if rows:
+            logger.info("Migrated %d jobs from %s to %s.", len(rows), csv_path, self.path)
+        if seen:
+            logger.info("Migrated seen postings for %d companies from %s to %s.", len(seen), seen_path, self.path)
+
+    def _migrated(self):
+        with self.lock:
+            return self.conn.execute("SELECT value FROM meta WHERE key = 'migrated'").fetchone() is not None
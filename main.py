@@ -1,25 +1,40 @@
 #!/usr/bin/env python3
 
 # we run all scrapers in this file and we filter the postings by title and location
-# then we check if the job is already in our database (csv file) and if not,
-# we will add it to the pool of data that we will email to the user and later
-# save to the csv file
+# then we check if the job is already in our database (jobs.db) and if not,
+# we save it as pending, and once every company is done the pending jobs are
+# emailed to the user and marked as sent
+import argparse
+import logging
+import socket
+import subprocess
+import sys
+import uuid
 import yaml
-import pandas as pd
-from datetime import datetime
-from company_scrapers.workday_scraper import scrape_workday
-import json
-from email_utils import send_email  # Assuming you have an email_utils.py for sending emails
-import re
-import chromedriver_autoinstaller  
+from datetime import datetime, timedelta
+from functools import partial
+from itertools import islice
+from company_scrapers.workday_scraper import (
+    scrape_workday, scrape_workday_selenium, resolve_workday_locations, _unresolved,
+)
+from company_scrapers.driver_pool import configure_pool, close_pool
+from company_scrapers.workday_api import set_fetch_cache
+from fetch_cache import FetchCache, CACHE_FILE
+from scheduler import run_companies, plan_companies, print_summary, shard_of, parse_shard, join_abandoned
+from job_store import JobStore, DB_FILE
+from matcher import JobMatcher
+from metrics import metrics, setup_logging
 import os
 
+logger = logging.getLogger(__name__)
+
 # ensure we are in the correct directory
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
-# install latest chromedriver
-chromedriver_autoinstaller.install()  
+# chromedriver is installed when the first browser is started (see driver_pool.install_chromedriver),
+# and selenium, asyncio and jinja are imported by the stages that use them, so a run that only
+# reads the workday api or has nothing to send doesn't wait for them
 
-# csv file that contains all sent jobs
+# csv file that contained all sent jobs before they were moved to the database
 CSV_FILE = "sent_jobs.csv"
 
 # config file for filtering jobs by title and location
@@ -27,223 +42,490 @@ def load_config(path="config.yaml"):
     with open(path, "r") as f:
         return yaml.safe_load(f)
 
-# load jobs sent from the csv file
-def load_previous_jobs():
-    try:
-        df = pd.read_csv(CSV_FILE, parse_dates=[5])
-        df["location"] = df["location"].apply(json.loads)
-    except Exception as e:
-        print(f"Error loading previous jobs: {e}")
-    
-    print(df.head())
-    return df
-
-# filters out jobs that have already been sent, mainly using the link as the identifier
-def filter_jobs_in_dataframe(jobs, df, company_name):
-    # returns the jobs that are not in the dataframe, if they are then the age must be greater than 14 days
-    if df.empty:
-        return jobs
-    
-    # we are only interested in jobs from the specified company
-    df = df[df['company'] == company_name]
-
-    df_links = set(df['link'])
-    filtered_jobs = []
-    for job in jobs:
-        title = job.get("title")
-        link = job.get("link", "")
-
-        # if the title and link is in the dataframe, we skip it. Some job titles have the same name
-        # so we use the link to ensure that it's a unique posting
-        if link in df_links:
-            prev_title = df[df['link'] == link]['title'].values[0].lower()
-            if title.lower() == prev_title:
-                print(f"Skipping {title} because it has already been sent.")
-                continue
+# scraped jobs are filtered this many at a time, so a company's postings are filtered while
+# the rest are still being scraped instead of all being held in memory first
+FILTER_BATCH = 100
+
+
+def _batched(jobs, size):
+    jobs = iter(jobs)
+    while batch := list(islice(jobs, size)):
+        yield batch
 
-        filtered_jobs.append(job)
-    
-    return filtered_jobs
 
+# yields the jobs whose title matches one of the key groups and that haven't been sent yet.
+# multi-location postings only say "N Locations" until they're resolved, so locations are
+# checked afterwards in filter_locations
+def filter_jobs(scraped_jobs, store, matcher, company_name):
+    for batch in _batched(scraped_jobs, FILTER_BATCH):
+        # first filter by title
+        with metrics.timer("filter"):
+            filtered_jobs = [job for job in batch if matcher.match_title(job.get("title")) is not None]
+        if not filtered_jobs:
+            continue
 
-# checks if any of the words in the job title match the keywords in the config file
-def keyword_match(job_title, key_groups):
-    title = job_title.lower()
-    for keywords in key_groups.values():
-        for keyword in keywords:
-            keyword = keyword.lower()
-            pattern = r"\b" + re.escape(keyword) + r"\b"
-            if re.search(pattern, title):
-                print(f"Found keyword match: {keyword} in {title}")
-                return True
+        # filter jobs from the ones that have been sent already
+        with metrics.timer("dedup"):
+            filtered_jobs = store.filter_unsent(filtered_jobs, company_name)
+        yield from filtered_jobs
 
 
-def filter_jobs(scraped_jobs, prev_scraped_jobs, config, company_name):
-    print("filtering...")
+# keeps the jobs that have a location in one of the location groups
+def filter_locations(jobs, matcher):
     filtered_jobs = []
-    # load the configs
-    key_groups = config.get("key_groups", {})
-    locations = config.get("locations", [])
+    with metrics.timer("filter"):
+        for job in jobs:
+            location_group = matcher.match_location(job.get("location"))
+            if location_group is None:
+                continue
+            logger.info("Found match: %s in %s", job["title"], location_group)
+            filtered_jobs.append(job)
+    return filtered_jobs
+
 
-    # first filter about by title and location
+# tags the scraped jobs with their company and keeps every link for save_company
+def _track(scraped_jobs, company, links):
     for job in scraped_jobs:
-        title = job.get("title").lower()
-        location = job.get("location") # a list of locations or a single location
-        NON_US_KEYWORDS = ["india", "china", "philippines", "brazil"]
-        location_found = False
-        # check if location matches any of the locations in the config
-        for _, keywords in locations.items(): # location, [locations]
-            for keyword in keywords: # each string that repesents a location
-                keyword = keyword.lower()
-                pattern = r"\b" + re.escape(keyword) + r"\b"  # Match whole words only
-                for loc in location: # a list of locations in the job posting
-                    loc = loc.lower()
-
-                    if "remote" in loc and keyword == "remote":
-                        if any(non_us in loc for non_us in NON_US_KEYWORDS):
-                            print(f"Skipping {title} because it is a remote job in a non-US location: {loc}")
-                            continue
-
-                    if re.search(pattern, loc):  # Check if the keyword matches the location
-                        print(f"Found location match: {keyword} in {loc} for job {title}")
-                        location_found = True
-                        break
-                if location_found:
-                    break
-            if location_found:
-                break
-        # move on to the next job posting if no location matches
-        if not location_found:
-            continue
+        job["company"] = company
+        links.append(job["link"])
+        yield job
 
-        # check any of the keywords are in the title
-        if not keyword_match(title, key_groups):
-            continue
-        # append job to the list
-        filtered_jobs.append(job)
 
-    # filter jobs from the ones that have been sent already
-    filtered_jobs = filter_jobs_in_dataframe(filtered_jobs, prev_scraped_jobs, company_name)
-    return filtered_jobs
+# reads the jobs a scraper yields until it's done or fails. returns (jobs, error), with the jobs
+# read before the error so the pages that did load aren't thrown away
+def _drain(jobs):
+    collected = []
+    try:
+        for job in jobs:
+            collected.append(job)
+    except Exception as e:
+        return collected, e
+    return collected, None
+
+
+# the jobs whose locations couldn't be looked up in an earlier run are added back to the
+# company's candidates, unless the scrape found them again or they've been sent since
+def add_unresolved(store, company, candidates):
+    links = {job["link"] for job in candidates}
+    retries = [job for job in store.unresolved_jobs(company) if job["link"] not in links]
+    return candidates + store.filter_unsent(retries, company) if retries else candidates
+
+
+# the company's new jobs (the candidates in one of the location groups) are saved as pending
+# and its postings marked as seen as soon as it's done, so a run that dies before the email
+# loses nothing and can skip the company when it's resumed. candidates whose locations couldn't
+# be looked up are kept to be tried again next run. returns (jobs scraped, new jobs, postings not
+# seen before). a scrape that failed (error) raises once the new jobs it did find are saved, so
+# it's reported and scheduled as a failure. its postings aren't marked as seen and the company
+# isn't checkpointed, so the next run scrapes it again from the start. total is how many postings
+# the site said it has, or None if it didn't say (selenium): a scrape that found nothing is only
+# fine if the site said it has nothing, otherwise the page most likely didn't load and it fails
+# too. the matcher's fingerprint is saved with the seen postings (see incremental_state)
+def save_company(store, company, url, links, candidates, matcher, error=None, total=None):
+    new_jobs = filter_locations([job for job in candidates if not _unresolved(job)], matcher)
+    store.save_sent(new_jobs, emailed=False)
+    store.save_unresolved(company, [job for job in candidates if _unresolved(job)])
+    if error is None and not links and total != 0:
+        error = RuntimeError(f"no postings found at {url}")
+    if error is not None:
+        raise error
+    if not links:
+        logger.info("%s has no postings.", company)
+    unseen = store.mark_seen(company, links, links[0] if links else None, matcher.fingerprint)
+    store.finish_company(company)
+    return len(links), len(new_jobs), unseen
+
+
+# (known_links, stop_after, high_water) for an incremental scrape of company. every posting
+# scraped is marked seen, including the ones the filters threw away, so if the keywords or
+# locations changed since the company's postings were marked seen they'd never be looked at
+# again. the company is read in full instead, until it's been saved with the new filters
+def incremental_state(store, company, matcher, stop_after):
+    if not stop_after:
+        return None, None, None
+    if store.seen_filters(company) != matcher.fingerprint:
+        logger.info("The filters changed since %s was last scraped, reading every page.", company)
+        return None, None, None
+    return store.known_links(company), stop_after, store.high_water(company)
+
+
+# runs in a scheduler thread: streams the company's postings through the title filter and
+# dedup as they're scraped, and only then resolves locations for the jobs that are left so the
+# expensive detail page lookups are skipped for jobs that would be thrown away anyway
+def scrape_company(company, url, engine, store, matcher, stop_after):
+    links = []
+    totals = []
+    known_links, stop_after, high_water = incremental_state(store, company, matcher, stop_after)
+    scraped_jobs = scrape_workday(url, engine, known_links=known_links, stop_after=stop_after, high_water=high_water,
+                                  totals=totals)
+    # includes the filter and dedup of each batch, which are also timed on their own
+    with metrics.timer("scrape"):
+        candidates, error = _drain(filter_jobs(_track(scraped_jobs, company, links), store, matcher, company))
+    candidates = add_unresolved(store, company, candidates)
+    with metrics.timer("resolve_locations"):
+        resolve_workday_locations(candidates, cache=store)
+    return save_company(store, company, url, links, candidates, matcher, error, totals[0] if totals else None)
+
+
+# the same steps for the async engine, run as a coroutine on its event loop with client being
+# the shared workday_async.WorkdayClient. falls back to selenium on one of the client's browser
+# threads if the api fails. the database calls run on threads too, since they can wait on the
+# store's lock or on another shard's transaction and would hold up every company on the loop
+async def scrape_company_async(company, url, store, matcher, stop_after, client):
+    import asyncio
+
+    error = None
+    totals = []
+    with metrics.timer("scrape"):
+        known_links, stop_after, high_water = await asyncio.to_thread(
+            incremental_state, store, company, matcher, stop_after)
+        try:
+            scraped_jobs = await client.scrape(
+                url,
+                known_links=known_links,
+                stop_after=stop_after,
+                high_water=high_water,
+                totals=totals,
+            )
+        except Exception as e:
+            logger.warning("Workday API failed for %s, falling back to selenium: %s", url, e)
+            metrics.incr("api_fallbacks")
+            scraped_jobs, error = await client.in_browser(_drain, scrape_workday_selenium(url))
+
+    links = []
+    candidates = await asyncio.to_thread(
+        lambda: list(filter_jobs(_track(scraped_jobs, company, links), store, matcher, company)))
+    candidates = await asyncio.to_thread(add_unresolved, store, company, candidates)
+    with metrics.timer("resolve_locations"):
+        await client.resolve_locations(candidates, cache=store)
+    return await asyncio.to_thread(save_company, store, company, url, links, candidates, matcher, error,
+                                   totals[0] if totals else None)
+
 
+# career site of every company that uses workday
+WORKDAY_SITES = {
+    "Intel": "https://intel.wd1.myworkdayjobs.com/External",
+    "AT&T": "https://att.wd1.myworkdayjobs.com/ATTGeneral",
+    "Adobe": "https://adobe.wd5.myworkdayjobs.com/external_experienced",
+    "HP": "https://hp.wd5.myworkdayjobs.com/ExternalCareerSite",
+    "Salesforce": "https://salesforce.wd12.myworkdayjobs.com/External_Career_Site",
+    "Ancestry": "https://ancestry.wd5.myworkdayjobs.com/Careers",
+    "Slack": "https://salesforce.wd12.myworkdayjobs.com/Slack",
+    "Activision": "https://activision.wd1.myworkdayjobs.com/External",
+    "Autodesk": "https://autodesk.wd1.myworkdayjobs.com/Ext",
+    "Avant": "https://avant.wd1.myworkdayjobs.com/External_Careers",
+    "BlackBerry": "https://bb.wd3.myworkdayjobs.com/BlackBerry",
+    "Boston Dynamics": "https://bostondynamics.wd1.myworkdayjobs.com/Boston_Dynamics",
+    "Cadence": "https://cadence.wd1.myworkdayjobs.com/External_Careers",
+    "Dell": "https://dell.wd1.myworkdayjobs.com/External",
+    "DraftKings": "https://draftkings.wd1.myworkdayjobs.com/en-US/DraftKings/jobs",
+    "Etsy": "https://etsy.wd5.myworkdayjobs.com/Etsy_Careers",
+    "Workday": "https://workday.wd5.myworkdayjobs.com/Workday",
+    "Razer": "https://razer.wd3.myworkdayjobs.com/Careers",
+    "Red Hat": "https://redhat.wd5.myworkdayjobs.com/Jobs",
+    "Siemens": "https://onehealthineers.wd3.myworkdayjobs.com/SHSJB",
+    "Snapchat": "https://wd1.myworkdaysite.com/en-US/recruiting/snapchat/snap",
+    "Chevron": "https://chevron.wd5.myworkdayjobs.com/jobs",
+    "Mastercard": "https://mastercard.wd1.myworkdayjobs.com/CorporateCareers",
+    "NVIDIA": "https://nvidia.wd5.myworkdayjobs.com/NVIDIAExternalCareerSite",
+    "Microchip": "https://wd5.myworkdaysite.com/recruiting/microchiphr/External",
+    "NXP": "https://nxp.wd3.myworkdayjobs.com/careers",
+    "Analog Devices": "https://analogdevices.wd1.myworkdayjobs.com/External",
+    "Bank of America": "https://ghr.wd1.myworkdayjobs.com/Lateral-US",
+    "Citi": "https://citi.wd5.myworkdayjobs.com/CitiGlobal",
+    "Morgan Stanley": "https://ms.wd5.myworkdayjobs.com/External",
+    "BMO": "https://bmo.wd3.myworkdayjobs.com/External",
+    "Blackstone": "https://blackstone.wd1.myworkdayjobs.com/Blackstone_Careers",
+    "Toyota": "https://toyota.wd5.myworkdayjobs.com/TMNA",
+    "Southwest": "https://swa.wd1.myworkdayjobs.com/external",
+    "Abbott": "https://abbott.wd5.myworkdayjobs.com/abbottcareers",
+    "3M": "https://3m.wd1.myworkdayjobs.com/Search",
+    "Comcast": "https://comcast.wd5.myworkdayjobs.com/Comcast_Careers",
+    "The Washington Post": "https://washpost.wd5.myworkdayjobs.com/washingtonpostcareers",
+    "Warner Bros": "https://warnerbros.wd5.myworkdayjobs.com/en-US/global",
+    "Netflix": "https://netflix.wd1.myworkdayjobs.com/Netflix",
+    "Accenture": "https://accenture.wd103.myworkdayjobs.com/en-US/AccentureCareers/",
+    "Boeing": "https://boeing.wd1.myworkdayjobs.com/EXTERNAL_CAREERS",
+    "Applied Materials": "https://amat.wd1.myworkdayjobs.com/External",
+    "Northrop Grumman": "https://ngc.wd1.myworkdayjobs.com/Northrop_Grumman_External_Site",
+    "Nasdaq": "https://nasdaq.wd1.myworkdayjobs.com/US_External_Career_Site",
+    "Geico": "https://geico.wd1.myworkdayjobs.com/External",
+    "PayPal": "https://paypal.wd1.myworkdayjobs.com/jobs",
+    "U-Haul": "https://uhaul.wd1.myworkdayjobs.com/en-US/UhaulJobs",
+    "Sonos": "https://sonos.wd1.myworkdayjobs.com/Sonos",
+    "Gen": "https://gen.wd1.myworkdayjobs.com/careers",
+    "Everfox": "https://evergreenix.wd1.myworkdayjobs.com/external-careers2",
+    "Nelnet": "https://nelnet.wd1.myworkdayjobs.com/en-US/MyNelnet/jobs",
+    "Cox": "https://cox.wd1.myworkdayjobs.com/en-US/Cox_External_Career_Site_1/",
+    "Trimble": "https://trimble.wd1.myworkdayjobs.com/en-US/TrimbleCareers",
+    "Bose": "https://boseallaboutme.wd1.myworkdayjobs.com/Bose_Careers",
+    "Resmed": "https://resmed.wd3.myworkdayjobs.com/ResMed_External_Careers",
+    "Credit Acceptance": "https://creditacceptance.wd5.myworkdayjobs.com/en-US/Credit_Acceptance",
+    "Wex": "https://wexinc.wd5.myworkdayjobs.com/WEXInc",
+    "Disney": "https://disney.wd5.myworkdayjobs.com/disneycareer",
+    "Yahoo": "https://ouryahoo.wd5.myworkdayjobs.com/careers",
+    "Nordstrom": "https://nordstrom.wd501.myworkdayjobs.com/nordstrom_careers",
+    "Motorola": "https://motorolasolutions.wd5.myworkdayjobs.com/Careers",
+    "Reuters": "https://thomsonreuters.wd5.myworkdayjobs.com/External_Career_Site",
+    "GDIT": "https://gdit.wd5.myworkdayjobs.com/External_Career_Site",
+    "Western Alliance Bank": "https://westernalliancebank.wd5.myworkdayjobs.com/WAB",
+    "RTX": "https://globalhr.wd5.myworkdayjobs.com/REC_RTX_Ext_Gateway",
+    "Blue Yonder": "https://jda.wd5.myworkdayjobs.com/JDA_Careers",
+    "Discover": "https://discover.wd5.myworkdayjobs.com/Discover",
+    "Early Warning": "https://earlywarning.wd5.myworkdayjobs.com/earlywarningcareers",
+    "Target": "https://target.wd5.myworkdayjobs.com/targetcareers",
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scrape career sites and email the new jobs.")
+    parser.add_argument("--shard", help="only scrape shard I of N of the companies, e.g. 0/4. "
+                                        "every shard can run on its own machine against the same jobs.db")
+    parser.add_argument("--shards", type=int, help="run N shards as local processes and send one email at the end")
+    parser.add_argument("--no-email", action="store_true",
+                        help="save the new jobs as pending without sending them, a later run sends them")
+    return parser.parse_args()
 
-def save_jobs_to_csv(jobs, filename=CSV_FILE):
-    jobs_to_write = []
-    for job in jobs:
-        jobs_to_write.append({
-                "company": job["company"],
-                "title": job["title"],
-                "link": job["link"],
-                "location": json.dumps(job["location"]),
-                "job_id": job.get("job_id"),
-                "added_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
-    
-    df = pd.DataFrame(jobs_to_write)
-    df.to_csv(filename, mode='a', header=not pd.io.common.file_exists(filename), index=False)
 
 def main():
+    args = parse_args()
     config = load_config()
-    prev_scraped_jobs = load_previous_jobs()
-    jobs_to_send = []
+    log_config = config.get("logging", {})
+    setup_logging(log_config.get("level", "INFO"), log_config.get("json", False))
+    if args.shards:
+        run_local_shards(config, args.shards)
+        return
+
+    shard = parse_shard(args.shard) if args.shard else None
+    if shard:
+        metrics.shard = args.shard
+    store = JobStore(DB_FILE)
+    store.migrate(CSV_FILE)
+    history_config = config.get("history", {})
+    open_history_archive(store, history_config)
+    # every selenium scraper shares this pool of browsers
+    pool_config = config.get("driver_pool", {})
+    configure_pool(
+        pool_config.get("size", 4), pool_config.get("max_uses", 50),
+        profile=pool_config.get("profile", "default"), blocked_urls=pool_config.get("blocked_urls"),
+    )
+    fetch_cache = open_fetch_cache(config.get("fetch_cache", {}))
+    try:
+        run(config, store, shard, send=not args.no_email)
+        # shards running side by side would archive the same rows, only a run on its own or the
+        # process that started the shards does
+        if shard is None:
+            archive_history(store, history_config)
+    finally:
+        # companies that timed out are still running on their threads. quitting every browser
+        # first makes the ones waiting on selenium fail fast, then they get shutdown_grace seconds
+        # to finish before the store and cache are closed under them
+        close_pool()
+        still_running = join_abandoned(config.get("scheduler", {}).get("shutdown_grace", 60))
+        if still_running:
+            logger.warning("%d timed out companies are still running, anything they find is dropped.", still_running)
+        store.close()
+        if fetch_cache is not None:
+            fetch_cache.log_stats()
+            set_fetch_cache(None)
+            fetch_cache.close()
+        # per-company and per-stage timings for finding slow tenants and regressions
+        metrics_config = config.get("metrics", {})
+        metrics.write_report(metrics_config.get("report_dir", "reports"), metrics_config.get("prometheus_file"))
+
+
+# runs every shard as its own process on this machine, each with its own browsers, and sends
+# what they found in one email once they're all done
+def run_local_shards(config, shards):
+    # the database is created or upgraded and the old history imported before the shards start,
+    # so they don't all try it at once
+    store = JobStore(DB_FILE)
+    try:
+        store.migrate(CSV_FILE)
+        history_config = config.get("history", {})
+        open_history_archive(store, history_config)
+        workers = [
+            subprocess.Popen([sys.executable, os.path.abspath(__file__), "--shard", f"{i}/{shards}", "--no-email"])
+            for i in range(shards)
+        ]
+        failed = [i for i, worker in enumerate(workers) if worker.wait() != 0]
+        if failed:
+            logger.error("Shards %s exited with an error, sending what the others found.", failed)
+
+        send_pending(config, store)
+        archive_history(store, history_config)
+    finally:
+        store.close()
+
+
+# old sent jobs can be kept in parquet files instead of jobs.db, see history_archive.py. the
+# archive is imported here so pyarrow is only needed when it's enabled. once jobs have been
+# archived it can't be turned off again, the jobs in it would be sent a second time
+def open_history_archive(store, history_config):
+    if not history_config.get("archive", False):
+        archived = store.archived_count()
+        if archived:
+            raise RuntimeError(
+                f"{archived} sent jobs have been moved to the history archive, they would be sent again "
+                f"with history.archive off. turn it back on"
+            )
+        return
+    from history_archive import HistoryArchive, ARCHIVE_DIR
+
+    store.archive = HistoryArchive(history_config.get("path", ARCHIVE_DIR), history_config.get("max_files", 8))
+    store.index_archive()
+
+
+def archive_history(store, history_config):
+    if store.archive is None:
+        return
+    archived = store.archive_sent(history_config.get("archive_after_days", 30))
+    if archived:
+        logger.info("Moved %d sent jobs from %s to the archive.", archived, DB_FILE)
+
+
+# responses from the workday api are kept on disk between runs, see fetch_cache.py
+def open_fetch_cache(cache_config):
+    if not cache_config.get("enabled", True):
+        return None
+    ttls = {}
+    if "listing_ttl" in cache_config:
+        ttls["listing"] = cache_config["listing_ttl"]
+    if "detail_ttl" in cache_config:
+        ttls["detail"] = cache_config["detail_ttl"]
+    cache = FetchCache(
+        cache_config.get("path", CACHE_FILE),
+        max_bytes=cache_config.get("max_mb", 200) * 1024 * 1024,
+        ttls=ttls,
+    )
+    set_fetch_cache(cache)
+    return cache
+
+
+# shard is (i, N) to only scrape the companies in shard i, send=False leaves the new jobs pending
+def run(config, store, shard=None, send=True):
+    started = datetime.now()
+    # the title and location keywords are compiled once for every company
+    matcher = JobMatcher(config)
     # companies have their own scrapers
-    scrapers = {
-        "Intel": lambda: scrape_workday("https://intel.wd1.myworkdayjobs.com/External"),
-        "AT&T": lambda: scrape_workday("https://att.wd1.myworkdayjobs.com/ATTGeneral"),
-        "Adobe": lambda: scrape_workday("https://adobe.wd5.myworkdayjobs.com/external_experienced"),
-        "HP": lambda: scrape_workday("https://hp.wd5.myworkdayjobs.com/ExternalCareerSite"),
-        "Salesforce": lambda: scrape_workday("https://salesforce.wd12.myworkdayjobs.com/External_Career_Site"),
-        "Ancestry": lambda: scrape_workday("https://ancestry.wd5.myworkdayjobs.com/Careers"),
-        "Slack": lambda: scrape_workday("https://salesforce.wd12.myworkdayjobs.com/Slack"),
-        "Activision": lambda: scrape_workday("https://activision.wd1.myworkdayjobs.com/External"),
-        "Autodesk": lambda: scrape_workday("https://autodesk.wd1.myworkdayjobs.com/Ext"),
-        "Avant": lambda: scrape_workday("https://avant.wd1.myworkdayjobs.com/External_Careers"),
-        "BlackBerry": lambda: scrape_workday("https://bb.wd3.myworkdayjobs.com/BlackBerry"),
-        "Boston Dynamics": lambda: scrape_workday("https://bostondynamics.wd1.myworkdayjobs.com/Boston_Dynamics"),
-        "Cadence": lambda: scrape_workday("https://cadence.wd1.myworkdayjobs.com/External_Careers"),
-        "Dell": lambda: scrape_workday("https://dell.wd1.myworkdayjobs.com/External"),
-        "DraftKings": lambda: scrape_workday("https://draftkings.wd1.myworkdayjobs.com/en-US/DraftKings/jobs"),
-        "Etsy": lambda: scrape_workday("https://etsy.wd5.myworkdayjobs.com/Etsy_Careers"),
-        "Workday": lambda: scrape_workday("https://workday.wd5.myworkdayjobs.com/Workday"),
-        "Razer": lambda: scrape_workday("https://razer.wd3.myworkdayjobs.com/Careers"),
-        "Red Hat": lambda: scrape_workday("https://redhat.wd5.myworkdayjobs.com/Jobs"),
-        "Siemens": lambda: scrape_workday("https://onehealthineers.wd3.myworkdayjobs.com/SHSJB"),
-        "Snapchat": lambda: scrape_workday("https://wd1.myworkdaysite.com/en-US/recruiting/snapchat/snap"),
-        "Chevron": lambda: scrape_workday("https://chevron.wd5.myworkdayjobs.com/jobs"),
-        "Mastercard": lambda: scrape_workday("https://mastercard.wd1.myworkdayjobs.com/CorporateCareers"),
-        "NVIDIA": lambda: scrape_workday("https://nvidia.wd5.myworkdayjobs.com/NVIDIAExternalCareerSite"),
-        "Microchip": lambda: scrape_workday("https://wd5.myworkdaysite.com/recruiting/microchiphr/External"),
-        "NXP": lambda: scrape_workday("https://nxp.wd3.myworkdayjobs.com/careers"),
-        "Analog Devices": lambda: scrape_workday("https://analogdevices.wd1.myworkdayjobs.com/External"),
-        "Bank of America": lambda: scrape_workday("https://ghr.wd1.myworkdayjobs.com/Lateral-US"),
-        "Citi": lambda: scrape_workday("https://citi.wd5.myworkdayjobs.com/CitiGlobal"),
-        "Morgan Stanley": lambda: scrape_workday("https://ms.wd5.myworkdayjobs.com/External"),
-        "BMO": lambda: scrape_workday("https://bmo.wd3.myworkdayjobs.com/External"),
-        "Blackstone": lambda: scrape_workday("https://blackstone.wd1.myworkdayjobs.com/Blackstone_Careers"),
-        "Toyota": lambda: scrape_workday("https://toyota.wd5.myworkdayjobs.com/TMNA"),
-        "Southwest": lambda: scrape_workday("https://swa.wd1.myworkdayjobs.com/external"),
-        "Abbott": lambda: scrape_workday("https://abbott.wd5.myworkdayjobs.com/abbottcareers"),
-        "3M": lambda: scrape_workday("https://3m.wd1.myworkdayjobs.com/Search"),
-        "Comcast": lambda: scrape_workday("https://comcast.wd5.myworkdayjobs.com/Comcast_Careers"),
-        "The Washington Post": lambda: scrape_workday("https://washpost.wd5.myworkdayjobs.com/washingtonpostcareers"),
-        "Warner Bros": lambda: scrape_workday("https://warnerbros.wd5.myworkdayjobs.com/en-US/global"),
-        "Netflix": lambda: scrape_workday("https://netflix.wd1.myworkdayjobs.com/Netflix"),
-        "Accenture": lambda: scrape_workday("https://accenture.wd103.myworkdayjobs.com/en-US/AccentureCareers/"),
-        "Boeing": lambda: scrape_workday("https://boeing.wd1.myworkdayjobs.com/EXTERNAL_CAREERS"),
-        "Applied Materials": lambda: scrape_workday("https://amat.wd1.myworkdayjobs.com/External"),
-        "Northrop Grumman": lambda: scrape_workday("https://ngc.wd1.myworkdayjobs.com/Northrop_Grumman_External_Site"),
-        "Nasdaq": lambda: scrape_workday("https://nasdaq.wd1.myworkdayjobs.com/US_External_Career_Site"),
-        "Geico": lambda: scrape_workday("https://geico.wd1.myworkdayjobs.com/External"),
-        "PayPal": lambda: scrape_workday("https://paypal.wd1.myworkdayjobs.com/jobs"),
-        "U-Haul": lambda: scrape_workday("https://uhaul.wd1.myworkdayjobs.com/en-US/UhaulJobs"),
-        "Sonos": lambda: scrape_workday("https://sonos.wd1.myworkdayjobs.com/Sonos"),
-        "Gen": lambda: scrape_workday("https://gen.wd1.myworkdayjobs.com/careers"),
-        "Everfox": lambda: scrape_workday("https://evergreenix.wd1.myworkdayjobs.com/external-careers2"),
-        "Nelnet": lambda: scrape_workday("https://nelnet.wd1.myworkdayjobs.com/en-US/MyNelnet/jobs"),
-        "Cox": lambda: scrape_workday("https://cox.wd1.myworkdayjobs.com/en-US/Cox_External_Career_Site_1/"),
-        "Trimble": lambda: scrape_workday("https://trimble.wd1.myworkdayjobs.com/en-US/TrimbleCareers"),
-        "Bose": lambda: scrape_workday("https://boseallaboutme.wd1.myworkdayjobs.com/Bose_Careers"),
-        "Resmed": lambda: scrape_workday("https://resmed.wd3.myworkdayjobs.com/ResMed_External_Careers"),
-        "Credit Acceptance": lambda: scrape_workday("https://creditacceptance.wd5.myworkdayjobs.com/en-US/Credit_Acceptance"),
-        "Wex": lambda: scrape_workday("https://wexinc.wd5.myworkdayjobs.com/WEXInc"),
-        "Disney": lambda: scrape_workday("https://disney.wd5.myworkdayjobs.com/disneycareer"),
-        "Yahoo": lambda: scrape_workday("https://ouryahoo.wd5.myworkdayjobs.com/careers"),
-        "Nordstrom": lambda: scrape_workday("https://nordstrom.wd501.myworkdayjobs.com/nordstrom_careers"),
-        "Motorola": lambda: scrape_workday("https://motorolasolutions.wd5.myworkdayjobs.com/Careers"),
-        "Reuters": lambda: scrape_workday("https://thomsonreuters.wd5.myworkdayjobs.com/External_Career_Site"),
-        "GDIT": lambda: scrape_workday("https://gdit.wd5.myworkdayjobs.com/External_Career_Site"),
-        "Western Alliance Bank": lambda: scrape_workday("https://westernalliancebank.wd5.myworkdayjobs.com/WAB"),
-        "RTX": lambda: scrape_workday("https://globalhr.wd5.myworkdayjobs.com/REC_RTX_Ext_Gateway"),
-        "Blue Yonder": lambda: scrape_workday("https://jda.wd5.myworkdayjobs.com/JDA_Careers"),
-        "Discover": lambda: scrape_workday("https://discover.wd5.myworkdayjobs.com/Discover"),
-        "Early Warning": lambda: scrape_workday("https://earlywarning.wd5.myworkdayjobs.com/earlywarningcareers"),
-        "Target": lambda: scrape_workday("https://target.wd5.myworkdayjobs.com/targetcareers"),
-    }
-
-    for company, scraper in scrapers.items():
-        print(f"Running: {company}")
-        try:
-            scraped_jobs = scraper()
-            for job in scraped_jobs:
-                job["company"] = company
+    engine = config.get("workday_engine", "api")
+    # incremental scraping stops paging a company once stop_after postings in a row have been
+    # seen before, either in a previous scrape or in the sent jobs
+    incremental = config.get("incremental", {})
+    stop_after = incremental.get("stop_after", 20) if incremental.get("enabled", True) else None
 
-            # filter the jobs based on config and if not already in previous jobs
-            filtered_jobs = filter_jobs(scraped_jobs, prev_scraped_jobs, config, company)
+    sites = WORKDAY_SITES
+    scope = None
+    if shard is not None:
+        index, count = shard
+        sites = {company: url for company, url in sites.items() if shard_of(company, count) == index}
+        scope = f"{index}/{count}"
+        logger.info("Shard %s: %d of %d companies.", scope, len(sites), len(WORKDAY_SITES))
 
-            # append the filtered jobs to the list of jobs to send
-            jobs_to_send.extend(filtered_jobs)
-        except Exception as e:
-            print(f"Error scraping {company}: {e}")
+    # a run that was interrupted is picked up where it left off, skipping the companies it finished
+    finished = store.start_run(sites, config.get("resume", {}).get("max_age_hours", 12), scope)
+    companies = list(sites)
+    sites = {company: url for company, url in sites.items() if company not in finished}
+    if finished:
+        logger.info("Skipping %d companies finished by the interrupted run.", len(finished))
+
+    # companies that rarely post are scraped less often than the ones that post all the time,
+    # and the run is kept within the time budget
+    scheduler_config = config.get("scheduler", {})
+    adaptive = config.get("adaptive", {})
+    budget = None
+    if adaptive.get("enabled", True):
+        budget = adaptive["budget_minutes"] * 60 if adaptive.get("budget_minutes") else None
+        selected, skipped = plan_companies(
+            sites, store.company_stats(),
+            budget=budget,
+            workers=None if engine == "async" else scheduler_config.get("max_workers", 8),
+            threshold=adaptive.get("threshold", 1.0),
+            min_interval=adaptive.get("min_interval_hours", 0),
+            max_interval=adaptive.get("max_interval_hours", 24),
+        )
+        if skipped:
+            logger.info("Scraping %d companies, %d aren't due yet: %s", len(selected), len(skipped), ", ".join(skipped))
+        sites = {company: sites[company] for company in selected}
+
+    # companies run concurrently and their new jobs are saved as each one finishes
+    if engine == "async":
+        # one event loop for every company, imported here so aiohttp is only needed for this engine
+        from company_scrapers.workday_async import run_companies_async
+
+        async_config = config.get("async", {})
+        tasks = {
+            company: (url, partial(scrape_company_async, company, url, store, matcher, stop_after))
+            for company, url in sites.items()
+        }
+        results = run_companies_async(
+            tasks,
+            max_requests=async_config.get("max_requests", 200),
+            per_host=async_config.get("per_host", 16),
+            timeout=scheduler_config.get("timeout", 600),
+            budget=budget,
+        )
+    else:
+        tasks = {
+            company: (url, partial(scrape_company, company, url, engine, store, matcher, stop_after))
+            for company, url in sites.items()
+        }
+        results = run_companies(
+            tasks,
+            max_workers=scheduler_config.get("max_workers", 8),
+            per_host=scheduler_config.get("per_host", 2),
+            timeout=scheduler_config.get("timeout", 600),
+            budget=budget,
+        )
+
+    summary = []
+    for result in results:
+        company = result["company"]
+        summary.append(result)
+        if result["status"] == "skipped":
             continue
-    
-    # send email with the jobs
+        new_postings = 0
+        if result["status"] == "timeout":
+            logger.warning("Timed out scraping %s after %.0fs", company, result["duration"])
+        elif result["status"] == "error":
+            logger.error("Error scraping %s: %s", company, result["error"])
+        else:
+            result["jobs_found"], result["jobs_new"], new_postings = result["output"]
+        store.record_company_run(company, result["status"], result["duration"], new_postings, started=started)
+
+    print_summary(summary)
+
+    if send:
+        send_pending(config, store)
+    store.finish_run(companies, scope)
+
+
+# emails the new jobs from this run plus any an earlier run (or another shard) saved but didn't
+# send. the jobs are claimed first so shards finishing at the same time never send the same one,
+# then moved to the outbox, which is sent along with anything an earlier run failed to send.
+# in digest mode the jobs stay pending until digest_hours have passed since the last email
+def send_pending(config, store):
+    from email_utils import render_email, deliver_outbox
+
+    email_config = config.get("email", {})
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    jobs_to_send = store.claim_pending(owner)
+    digest_hours = email_config.get("digest_hours")
+    last_email = store.last_email()
     if len(jobs_to_send) == 0:
-        print("No new jobs to send.")
-        return
-    
-    send_email(jobs_to_send, config.get("email_recipients"))
-    save_jobs_to_csv(jobs_to_send)
-    print(f"Saved {len(jobs_to_send)} jobs to {CSV_FILE}.")
+        logger.info("No new jobs to send.")
+    elif digest_hours and last_email and datetime.now() - last_email < timedelta(hours=digest_hours):
+        store.release_claim(owner)
+        logger.info("Holding %d jobs for the next digest.", len(jobs_to_send))
+    else:
+        subject, html = render_email(jobs_to_send)
+        recipients = config.get("email_recipients")
+        if email_config.get("bcc", False):
+            messages = [(recipients, subject, html)]
+        else:
+            messages = [([recipient], subject, html) for recipient in recipients]
+        store.queue_email(jobs_to_send, messages)
+        logger.info("Queued %d jobs, saved in %s.", len(jobs_to_send), DB_FILE)
+    deliver_outbox(store, owner)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,74 @@
+# matches job titles and locations against the key_groups and locations in config.yaml.
+# every keyword is compiled once into a single regex per section (one named group per config
+# group) so checking a job is one search no matter how many keywords there are, and location
+# strings are cached since the same few ("Santa Clara, California, US") repeat thousands of times
+import hashlib
+import json
+import re
+
+# remote postings in these countries don't count as a "remote" location match
+NON_US_KEYWORDS = ["india", "china", "philippines", "brazil"]
+
+
+# builds (?P<g0>\b(?:kw1|kw2)\b)|(?P<g1>...) and the group name each g<n> stands for
+def compile_groups(groups):
+    alternatives = []
+    names = {}
+    for i, (name, keywords) in enumerate(groups.items()):
+        keywords = sorted({keyword.lower() for keyword in keywords}, key=len, reverse=True)
+        if not keywords:
+            continue
+        names[f"g{i}"] = name
+        alternatives.append(f"(?P<g{i}>\\b(?:{'|'.join(re.escape(keyword) for keyword in keywords)})\\b)")
+
+    if not alternatives:
+        return None, names
+    return re.compile("|".join(alternatives)), names
+
+
+class JobMatcher:
+    def __init__(self, config, cache_size=100_000):
+        self.title_pattern, self.title_groups = compile_groups(config.get("key_groups") or {})
+        self.location_pattern, self.location_groups = compile_groups(config.get("locations") or {})
+        # changes whenever a keyword or location is added or removed, see JobStore.seen_filters
+        self.fingerprint = hashlib.sha1(json.dumps(
+            [config.get("key_groups") or {}, config.get("locations") or {}], sort_keys=True).encode()).hexdigest()
+        self.cache_size = cache_size
+        self._location_cache = {}
+
+    # returns the key group the title matched, or None
+    def match_title(self, title):
+        if self.title_pattern is None:
+            return None
+        match = self.title_pattern.search(title.lower())
+        return self.title_groups[match.lastgroup] if match else None
+
+    # returns the location group the first matching posting location is in, or None.
+    # locations can be a list of locations or a single one
+    def match_location(self, locations):
+        if isinstance(locations, str):
+            locations = [locations]
+        for location in locations:
+            group = self._match_one_location(location)
+            if group is not None:
+                return group
+        return None
+
+    def _match_one_location(self, location):
+        key = " ".join(location.lower().split())
+        if key in self._location_cache:
+            return self._location_cache[key]
+
+        group = None
+        if self.location_pattern is not None:
+            non_us = any(non_us in key for non_us in NON_US_KEYWORDS)
+            for match in self.location_pattern.finditer(key):
+                if non_us and match.group() == "remote":
+                    continue
+                group = self.location_groups[match.lastgroup]
+                break
+
+        if len(self._location_cache) >= self.cache_size:
+            self._location_cache.clear()
+        self._location_cache[key] = group
+        return group
@@ -0,0 +1,201 @@
+# timings and counters for a run, broken down by stage and company, plus the logging setup.
+# stages are timed with
+#   with metrics.timer("page_load"):
+#       ...
+# and counted with metrics.incr("pages"). the company is picked up from the thread or asyncio
+# task that's scraping it (see metrics.company) so the scrapers don't need to pass it around. at the end
+# of a run the totals are written as json and as a prometheus textfile
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# a context variable rather than a thread local so every asyncio task has its own company,
+# new threads start without one
+_company = contextvars.ContextVar("company", default=None)
+
+
+def current_company():
+    return _company.get()
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.shard = None # "i/N" when this process runs one shard of a sharded run
+        self.timings = {} # (stage, company) -> {"count", "total", "max"}
+        self.counters = {} # (name, company) -> count
+
+    # everything timed or counted on this thread (or asyncio task) inside the block is for company
+    @contextmanager
+    def company(self, company):
+        token = _company.set(company)
+        try:
+            yield
+        finally:
+            _company.reset(token)
+
+    @contextmanager
+    def timer(self, stage, company=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, company)
+
+    def record(self, stage, seconds, company=None):
+        key = (stage, company or current_company())
+        with self.lock:
+            timing = self.timings.setdefault(key, {"count": 0, "total": 0.0, "max": 0.0})
+            timing["count"] += 1
+            timing["total"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+
+    def incr(self, name, n=1, company=None):
+        key = (name, company or current_company())
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def report(self):
+        with self.lock:
+            stages = {}
+            companies = {}
+            for (stage, company), timing in self.timings.items():
+                total = stages.setdefault(stage, {"count": 0, "total": 0.0, "max": 0.0})
+                total["count"] += timing["count"]
+                total["total"] += timing["total"]
+                total["max"] = max(total["max"], timing["max"])
+                if company is not None:
+                    companies.setdefault(company, {"stages": {}, "counters": {}})["stages"][stage] = dict(timing)
+            counters = {}
+            for (name, company), count in self.counters.items():
+                counters[name] = counters.get(name, 0) + count
+                if company is not None:
+                    companies.setdefault(company, {"stages": {}, "counters": {}})["counters"][name] = count
+
+        return {
+            "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "duration": time.time() - self.started,
+            "shard": self.shard,
+            "stages": stages,
+            "counters": counters,
+            "companies": companies,
+        }
+
+    # every value is for the last run and is replaced by the next one, so they're all gauges, and
+    # none are named _total since that suffix is for counters
+    def prometheus(self):
+        lines = [
+            "# HELP job_scraper_stage_seconds Time spent in each stage of the last run.",
+            "# TYPE job_scraper_stage_seconds gauge",
+        ]
+        with self.lock:
+            timings = sorted(self.timings.items(), key=lambda item: (item[0][0], item[0][1] or ""))
+            counters = sorted(self.counters.items(), key=lambda item: (item[0][0], item[0][1] or ""))
+        for (stage, company), timing in timings:
+            lines.append(f"job_scraper_stage_seconds{_labels(stage=stage, company=company, shard=self.shard)} {timing['total']:.6f}")
+        lines += [
+            "# HELP job_scraper_stage_calls Times each stage ran in the last run.",
+            "# TYPE job_scraper_stage_calls gauge",
+        ]
+        for (stage, company), timing in timings:
+            lines.append(f"job_scraper_stage_calls{_labels(stage=stage, company=company, shard=self.shard)} {timing['count']}")
+        lines += [
+            "# HELP job_scraper_stage_seconds_max Slowest single call of each stage in the last run.",
+            "# TYPE job_scraper_stage_seconds_max gauge",
+        ]
+        for (stage, company), timing in timings:
+            lines.append(f"job_scraper_stage_seconds_max{_labels(stage=stage, company=company, shard=self.shard)} {timing['max']:.6f}")
+        lines += [
+            "# HELP job_scraper_events Pages, cards, retries, timeouts and errors in the last run.",
+            "# TYPE job_scraper_events gauge",
+        ]
+        for (name, company), count in counters:
+            lines.append(f"job_scraper_events{_labels(name=name, company=company, shard=self.shard)} {count}")
+        run_labels = _labels(shard=self.shard) if self.shard else ""
+        lines += [
+            "# HELP job_scraper_run_duration_seconds How long the last run took.",
+            "# TYPE job_scraper_run_duration_seconds gauge",
+            f"job_scraper_run_duration_seconds{run_labels} {time.time() - self.started:.3f}",
+            "# HELP job_scraper_last_run_timestamp_seconds When the last run started.",
+            "# TYPE job_scraper_last_run_timestamp_seconds gauge",
+            f"job_scraper_last_run_timestamp_seconds{run_labels} {self.started:.0f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    # writes <report_dir>/run-<start time>.json and, if given, the prometheus textfile.
+    # the textfile is written to a temp file first since node_exporter may read it at any time.
+    # each shard of a sharded run writes its own files, e.g. run-<start time>-shard1of4.json
+    def write_report(self, report_dir="reports", prometheus_file=None):
+        os.makedirs(report_dir, exist_ok=True)
+        stamp = datetime.fromtimestamp(self.started).strftime("%Y%m%d-%H%M%S")
+        suffix = "-shard{}of{}".format(*self.shard.split("/")) if self.shard else ""
+        report_path = os.path.join(report_dir, f"run-{stamp}{suffix}.json")
+        with open(report_path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        logger.info("Wrote run report to %s", report_path)
+
+        if prometheus_file:
+            root, ext = os.path.splitext(prometheus_file)
+            prometheus_file = root + suffix + ext
+            tmp_path = prometheus_file + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(self.prometheus())
+            os.replace(tmp_path, prometheus_file)
+            logger.info("Wrote prometheus metrics to %s", prometheus_file)
+        return report_path
+
+
+def _labels(**labels):
+    parts = []
+    for key, value in labels.items():
+        if value is None:
+            continue
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+# shared by every module for the whole run
+metrics = Metrics()
+
+
+class _CompanyFilter(logging.Filter):
+    def filter(self, record):
+        record.company = current_company() or "-"
+        return True
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "company": record.company,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+# logs go to stderr, one line per message with the company being scraped on that thread.
+# json=True writes every line as a json object for log collectors
+def setup_logging(level="INFO", json_logs=False):
+    handler = logging.StreamHandler()
+    handler.addFilter(_CompanyFilter())
+    if json_logs:
+        handler.setFormatter(_JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s [%(company)s] %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
@@ -0,0 +1,203 @@
+# runs the company scrapers concurrently instead of one after another. there is a global
+# limit on how many companies run at once and a limit per workday data center (wd1, wd5, ...)
+# so a single host doesn't get all of the requests. results are yielded as soon as each
+# company finishes so they can be filtered while the others are still running.
+# plan_companies picks which companies are worth scraping this run from their history
+import hashlib
+import logging
+import queue
+import re
+import statistics
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# the workday data center a career site lives on, e.g. intel.wd1.myworkdayjobs.com -> wd1,
+# anything else is limited by its hostname
+def host_key(url):
+    hostname = urlparse(url).hostname or url
+    match = re.search(r"(?:^|\.)(wd\d+)\.", hostname)
+    return match.group(1) if match else hostname
+
+
+# which of shards a company belongs to. a hash of the name rather than python's hash(),
+# which changes between processes, so every worker and host agrees on it
+def shard_of(company, shards):
+    digest = hashlib.sha1(company.encode()).digest()
+    return int.from_bytes(digest[:8], "big") % shards
+
+
+# "1/4" -> (1, 4), shards are numbered from 0
+def parse_shard(text):
+    index, _, count = text.partition("/")
+    index, count = int(index), int(count)
+    if not 0 <= index < count:
+        raise ValueError(f"shard {text} should be i/N with 0 <= i < N")
+    return index, count
+
+
+# threads of the companies that timed out, see join_abandoned
+_abandoned = []
+_abandoned_lock = threading.Lock()
+
+
+def _run(company, scraper, results):
+    start = time.monotonic()
+    try:
+        with metrics.company(company), metrics.timer("company_total"):
+            output = scraper()
+        results.put({"company": company, "status": "ok", "output": output, "error": None,
+                     "duration": time.monotonic() - start})
+    except Exception as e:
+        metrics.incr("errors", company=company)
+        results.put({"company": company, "status": "error", "output": None, "error": e,
+                     "duration": time.monotonic() - start})
+
+
+# tasks is a dict of company -> (url, scraper) where scraper takes no arguments.
+# yields a result dict per company with its status ("ok", "error", "timeout" or "skipped"), what
+# the scraper returned, the error if any and how long it ran. a company that runs past the timeout
+# is reported and no longer counts against the limits, its thread is left to finish on its own
+# since python threads can't be killed (call join_abandoned before closing anything it uses).
+# once budget seconds have passed no more companies are started and the ones still waiting are
+# reported as skipped
+def run_companies(tasks, max_workers=8, per_host=2, timeout=600, budget=None):
+    pending = list(tasks.items())
+    running = {} # company -> (host, start time, thread)
+    host_counts = {}
+    results = queue.Queue()
+    started = time.monotonic()
+
+    while pending or running:
+        if budget is not None and pending and time.monotonic() - started > budget:
+            for company, _ in pending:
+                yield {"company": company, "status": "skipped", "output": None, "error": None, "duration": 0.0}
+            pending = []
+            logger.warning("Out of time, the remaining companies are skipped until the next run.")
+        # start as many companies as the limits allow, in the order they were given
+        for item in list(pending):
+            if len(running) >= max_workers:
+                break
+            company, (url, scraper) = item
+            host = host_key(url)
+            if host_counts.get(host, 0) >= per_host:
+                continue
+            pending.remove(item)
+            host_counts[host] = host_counts.get(host, 0) + 1
+            thread = threading.Thread(target=_run, args=(company, scraper, results), daemon=True)
+            running[company] = (host, time.monotonic(), thread)
+            logger.info("Running: %s", company)
+            thread.start()
+
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            result = None
+
+        if result is not None and result["company"] in running:
+            host, _, _ = running.pop(result["company"])
+            host_counts[host] -= 1
+            yield result
+
+        # give up on companies that ran too long
+        now = time.monotonic()
+        for company, (host, start, thread) in list(running.items()):
+            if now - start > timeout:
+                running.pop(company)
+                host_counts[host] -= 1
+                with _abandoned_lock:
+                    _abandoned.append(thread)
+                metrics.incr("timeouts", company=company)
+                yield {"company": company, "status": "timeout", "output": None, "error": None,
+                       "duration": now - start}
+
+
+# waits up to timeout seconds in all for the threads of companies that timed out, so they aren't
+# left writing to a database or cache that's closed under them. returns how many are still running
+def join_abandoned(timeout):
+    deadline = time.monotonic() + timeout
+    with _abandoned_lock:
+        threads = list(_abandoned)
+        _abandoned.clear()
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+    return sum(thread.is_alive() for thread in threads)
+
+
+# runs started by cron don't start at exactly the same second every day, a company whose
+# max_interval is up within this many hours is due already
+INTERVAL_SLACK = 0.25
+
+
+# picks the companies to scrape this run and the order to start them in. stats is
+# JobStore.company_stats(). a company is due once the postings it's expected to have added since
+# it was last scraped (its new postings per hour x the hours since) reach threshold, or once it
+# hasn't been scraped for max_interval hours, and never within min_interval hours. companies
+# without a rate yet (new, or only scraped once) are always due. companies that keep failing are
+# pushed back by their error rate. due companies are taken most expected postings first while
+# their average durations, spread over workers, fit in budget seconds. workers=None is for the
+# async engine, which runs every company at once, so the run takes as long as its slowest company.
+# returns (companies to scrape, companies skipped)
+def plan_companies(companies, stats, budget=None, workers=1, threshold=1.0, min_interval=0, max_interval=24,
+                   now=None):
+    now = now or datetime.now()
+    known_durations = [s["duration"] for s in stats.values() if s.get("duration") is not None]
+    default_duration = statistics.median(known_durations) if known_durations else 60.0
+
+    due = [] # (priority, company)
+    skipped = []
+    for company in companies:
+        stat = stats.get(company)
+        if stat is None or stat["last_scraped"] is None or stat["new_per_hour"] is None:
+            due.append((float("inf"), company))
+            continue
+        hours = (now - stat["last_scraped"]).total_seconds() / 3600
+        expected = stat["new_per_hour"] * hours / (1 + 4 * stat["error_rate"])
+        if hours < min_interval:
+            skipped.append(company)
+        elif hours >= max_interval - INTERVAL_SLACK:
+            due.append((float("inf"), company))
+        elif expected >= threshold:
+            due.append((expected, company))
+        else:
+            skipped.append(company)
+
+    # most overdue first, the sort is stable so ties keep the order they were given in
+    due.sort(key=lambda item: item[0], reverse=True)
+    selected = []
+    used = 0.0
+    for _, company in due:
+        duration = (stats.get(company) or {}).get("duration") or default_duration
+        # with every company at once each one only has to fit in the budget on its own
+        total = duration if workers is None else used + duration / workers
+        if budget is not None and selected and total > budget:
+            skipped.append(company)
+            continue
+        selected.append(company)
+        if workers is not None:
+            used = total
+    return selected, skipped
+
+
+def print_summary(summary):
+    logger.info("Run summary:")
+    for result in sorted(summary, key=lambda r: r["duration"], reverse=True):
+        line = f"  {result['company']:<25} {result['status']:<8} {result['duration']:7.1f}s"
+        if result.get("jobs_found") is not None:
+            line += f"  {result['jobs_found']} scraped, {result['jobs_new']} new"
+        if result["error"] is not None:
+            line += f"  ({result['error']})"
+        logger.info(line)
+    failed = [r["company"] for r in summary if r["status"] in ("error", "timeout")]
+    skipped = [r["company"] for r in summary if r["status"] == "skipped"]
+    logger.info("%d of %d companies succeeded", len(summary) - len(failed) - len(skipped), len(summary))
+    if failed:
+        logger.warning("Failed or timed out: %s", ", ".join(failed))
+    if skipped:
+        logger.warning("Skipped, out of time: %s", ", ".join(skipped))
@@ -0,0 +1,18 @@
+# the tests import the modules from the project root the same way main.py does, and run
+# against the local stand-ins in benchmarks/ instead of real career sites or mail servers
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fixture_server import start_fixture_server  # noqa: E402
+
+
+@pytest.fixture
+def fixture_server():
+    server = start_fixture_server(postings=50)
+    yield server
+    server.shutdown()
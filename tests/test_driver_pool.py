@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+
+from company_scrapers import driver_pool
+from company_scrapers.driver_pool import DriverPool
+
+
+class FakeDriver:
+    current_url = "about:blank"
+    window_handles = ["main"]
+
+    def __init__(self):
+        self.quit_called = False
+        self.switch_to = self
+
+    def window(self, handle):
+        pass
+
+    def delete_all_cookies(self):
+        pass
+
+    def get(self, url):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture
+def drivers(monkeypatch):
+    started = []
+
+    def new_driver(profile, blocked_urls):
+        started.append(FakeDriver())
+        return started[-1]
+
+    monkeypatch.setattr(driver_pool, "new_driver", new_driver)
+    return started
+
+
+def test_browsers_are_reused(drivers):
+    pool = DriverPool(size=2)
+    for _ in range(3):
+        with pool.lease():
+            pass
+    assert len(drivers) == 1
+    pool.close()
+    assert drivers[0].quit_called
+
+
+def test_close_quits_leased_browsers(drivers):
+    pool = DriverPool(size=2)
+    leased = threading.Event()
+    release = threading.Event()
+
+    def abandoned():
+        with pool.lease():
+            leased.set()
+            release.wait()
+
+    thread = threading.Thread(target=abandoned)
+    thread.start()
+    leased.wait()
+    pool.close()
+    assert drivers[0].quit_called
+    # given back after the pool closed, it isn't put back to be leased again
+    release.set()
+    thread.join()
+    with pytest.raises(RuntimeError):
+        with pool.lease():
+            pass
+    assert len(drivers) == 1
+
+
+def test_failed_location_lookups_are_retried(drivers, monkeypatch):
+    from company_scrapers import workday_scraper
+
+    monkeypatch.setattr(driver_pool, "_pool", DriverPool(size=2))
+    # retries are ready straight away, so they're taken off the queue right at their ready time
+    monkeypatch.setattr(workday_scraper, "RESOLVE_BACKOFF", 0)
+    failed = set()
+
+    def read_locations(driver, link):
+        if link not in failed:
+            failed.add(link)
+            raise RuntimeError("502")
+        return ["Remote", link]
+
+    monkeypatch.setattr(workday_scraper, "read_locations", read_locations)
+    jobs = [{"title": f"Job {i}", "link": f"job-{i}", "location": "2 Locations"} for i in range(20)]
+    workday_scraper.resolve_locations_parallel(jobs, max_workers=2)
+    assert all(job["location"] == ["Remote", job["link"]] for job in jobs)
+    driver_pool.close_pool()
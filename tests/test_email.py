@@ -0,0 +1,173 @@
+import email
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import email_utils
+from benchmarks.smtp_server import start_smtp_server
+from conftest import ROOT
+from email_utils import Mailer, deliver_outbox, render_email
+from job_store import MAX_SEND_ATTEMPTS, JobStore
+
+SENDER = "jobs@example.com"
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def smtp():
+    server = start_smtp_server()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(email_utils, "SEND_BACKOFF", 0)
+
+
+def _mailer(server):
+    return Mailer(host="127.0.0.1", port=server.port, ssl=False, user=SENDER, password=None)
+
+
+def _jobs(n, company="Acme"):
+    return [{"company": company, "title": f"Engineer {i}", "link": f"https://acme.example/job/{i}",
+             "location": ["Remote"], "job_id": f"R{i}"} for i in range(n)]
+
+
+def test_pending_jobs_are_claimed_once(store):
+    store.save_sent(_jobs(3), emailed=False)
+    assert len(store.claim_pending("a")) == 3
+    assert store.claim_pending("b") == []
+    store.release_claim("a")
+    assert len(store.claim_pending("b")) == 3
+
+
+def test_stale_claim_is_taken_over(store):
+    store.save_sent(_jobs(2), emailed=False)
+    store.claim_pending("dead")
+    assert len(store.claim_pending("b", stale_after=-1)) == 2
+
+
+def test_queue_email_moves_jobs_to_the_outbox(store):
+    store.save_sent(_jobs(2), emailed=False)
+    jobs = store.claim_pending("a")
+    store.queue_email(jobs, [(["x@example.com"], "subject", "<p>body</p>")])
+    assert store.claim_pending("b") == []
+    assert store.last_email() is not None
+    messages = store.claim_outbox("a")
+    assert [json.loads(m["recipients"]) for m in messages] == [["x@example.com"]]
+    assert store.claim_outbox("b") == []
+
+
+def test_deliver_outbox_sends_over_one_connection(store, smtp):
+    store.queue_email([], [([f"{name}@example.com"], "subject", "<p>body</p>") for name in "abc"])
+    assert deliver_outbox(store, "a", _mailer(smtp)) == 3
+    assert smtp.connections == 1
+    assert [m["to"] for m in smtp.messages] == [["a@example.com"], ["b@example.com"], ["c@example.com"]]
+    # nothing is sent twice
+    assert deliver_outbox(store, "a", _mailer(smtp)) == 0
+
+
+def test_failed_message_is_retried_next_run(store, smtp):
+    store.queue_email([], [(["a@example.com"], "subject", "<p>body</p>")])
+    smtp.fail_rate = 1.0
+    assert deliver_outbox(store, "a", _mailer(smtp)) == 0
+    attempts, error = store.conn.execute("SELECT attempts, last_error FROM outbox").fetchone()
+    assert attempts == 1 and "451" in error
+    assert smtp.messages == []
+
+    smtp.fail_rate = 0.0
+    assert deliver_outbox(store, "b", _mailer(smtp)) == 1
+    assert len(smtp.messages) == 1
+
+
+def test_message_that_keeps_failing_is_given_up_on(store, smtp, caplog):
+    store.queue_email([], [(["a@example.com"], "subject", "<p>body</p>")])
+    store.conn.execute("UPDATE outbox SET attempts = ?", (MAX_SEND_ATTEMPTS - 1,))
+    store.conn.commit()
+    smtp.fail_rate = 1.0
+    assert deliver_outbox(store, "a", _mailer(smtp)) == 0
+    assert "giving up" in caplog.text
+    smtp.fail_rate = 0.0
+    assert store.claim_outbox("b") == []
+
+
+def test_transient_failure_is_retried_in_the_same_run(store, smtp):
+    store.queue_email([], [([f"{i}@example.com"], "subject", "<p>body</p>") for i in range(10)])
+    # the stand-in's failures are seeded, one of these is refused once
+    smtp.fail_rate = 0.3
+    assert deliver_outbox(store, "a", _mailer(smtp)) == 10
+    assert smtp.connections == 1
+    assert sorted(m["to"][0] for m in smtp.messages) == sorted(f"{i}@example.com" for i in range(10))
+
+
+def test_bcc_sends_one_message(store, smtp):
+    store.queue_email([], [(["a@example.com", "b@example.com"], "subject", "<p>body</p>")])
+    deliver_outbox(store, "a", _mailer(smtp))
+    assert len(smtp.messages) == 1
+    message = smtp.messages[0]
+    assert message["to"] == ["a@example.com", "b@example.com"]
+    # the recipients don't see each other
+    assert email.message_from_bytes(message["data"])["To"] == SENDER
+
+
+def test_digest_holds_jobs_until_due(store, smtp, monkeypatch):
+    import main
+
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(email_utils, "Mailer", lambda: _mailer(smtp))
+    config = {"email": {"digest_hours": 24}, "email_recipients": ["a@example.com"]}
+
+    store.save_sent(_jobs(2), emailed=False)
+    main.send_pending(config, store)
+    assert len(smtp.messages) == 1
+
+    store.save_sent(_jobs(1, company="Globex"), emailed=False)
+    main.send_pending(config, store)
+    assert len(smtp.messages) == 1
+    assert len(store.claim_pending("check")) == 1
+    store.release_claim("check")
+
+    store.conn.execute("UPDATE meta SET value = ? WHERE key = 'last_email'",
+                       ((datetime.now() - timedelta(hours=25)).strftime("%Y-%m-%d %H:%M:%S"),))
+    store.conn.commit()
+    main.send_pending(config, store)
+    assert len(smtp.messages) == 2
+
+
+def test_render_email(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    subject, html = render_email(_jobs(2) + _jobs(1, company="Globex"))
+    assert subject == "New Job Postings from Acme, Globex"
+    assert "https://acme.example/job/1" in html
+
+
+def test_archive_is_only_read_for_archived_links(store, tmp_path, monkeypatch):
+    import main
+    from history_archive import HistoryArchive
+
+    store.save_sent(_jobs(3), emailed=True)
+    store.archive = HistoryArchive(str(tmp_path / "history"))
+    assert store.archive_sent(-1) == 3
+    reads = []
+    monkeypatch.setattr(store.archive, "sent_titles", lambda company, links: reads.append(set(links)) or {})
+    store.sent_titles("Acme", ["https://acme.example/job/new"])
+    assert reads == []
+    store.sent_titles("Acme", ["https://acme.example/job/1", "https://acme.example/job/new"])
+    assert reads == [{"https://acme.example/job/1"}]
+
+    # an archive from before the index is indexed when it's opened
+    store.conn.execute("DELETE FROM archived_links")
+    store.conn.commit()
+    main.open_history_archive(store, {"archive": True, "path": str(tmp_path / "history")})
+    assert store.filter_unsent(_jobs(3), "Acme") == []
+
+    with pytest.raises(RuntimeError, match="history.archive"):
+        main.open_history_archive(store, {"archive": False})
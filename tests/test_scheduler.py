@@ -0,0 +1,89 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from scheduler import join_abandoned, parse_shard, plan_companies, run_companies, shard_of
+
+NOW = datetime(2026, 1, 2, 8, 0, 0)
+
+
+def _stats(hours_ago, new_per_hour, duration=60.0, error_rate=0.0):
+    return {"runs": 5, "last_scraped": NOW - timedelta(hours=hours_ago), "new_per_hour": new_per_hour,
+            "duration": duration, "error_rate": error_rate}
+
+
+def test_new_companies_are_due():
+    selected, skipped = plan_companies(["A", "B"], {}, now=NOW)
+    assert selected == ["A", "B"] and skipped == []
+
+
+def test_quiet_company_waits_until_a_posting_is_expected():
+    # one posting a day, last scraped 6 hours ago
+    selected, skipped = plan_companies(["Quiet"], {"Quiet": _stats(6, 1 / 24)}, now=NOW)
+    assert selected == [] and skipped == ["Quiet"]
+    selected, _ = plan_companies(["Quiet"], {"Quiet": _stats(25, 1 / 24)}, now=NOW)
+    assert selected == ["Quiet"]
+
+
+def test_max_interval_allows_for_cron_jitter():
+    # scraped in yesterday's run, which started a few minutes later than today's
+    selected, _ = plan_companies(["Quiet"], {"Quiet": _stats(23.95, 0.0)}, max_interval=24, now=NOW)
+    assert selected == ["Quiet"]
+
+
+def test_min_interval():
+    selected, skipped = plan_companies(["Busy"], {"Busy": _stats(0.5, 100)}, min_interval=1, now=NOW)
+    assert selected == [] and skipped == ["Busy"]
+
+
+def test_failing_company_is_pushed_back():
+    stats = {"Flaky": _stats(2, 0.6, error_rate=1.0), "Steady": _stats(2, 0.6)}
+    selected, skipped = plan_companies(["Flaky", "Steady"], stats, now=NOW)
+    assert selected == ["Steady"] and skipped == ["Flaky"]
+
+
+def test_most_expected_postings_go_first():
+    stats = {"Slow": _stats(2, 1), "Fast": _stats(2, 10)}
+    selected, _ = plan_companies(["Slow", "Fast"], stats, now=NOW)
+    assert selected == ["Fast", "Slow"]
+
+
+def test_budget_is_spread_over_workers():
+    companies = [f"C{i}" for i in range(10)]
+    stats = {company: _stats(30, 1, duration=60) for company in companies}
+    selected, skipped = plan_companies(companies, stats, budget=300, workers=1, now=NOW)
+    assert len(selected) == 5 and len(skipped) == 5
+    selected, _ = plan_companies(companies, stats, budget=300, workers=2, now=NOW)
+    assert len(selected) == 10
+
+
+def test_budget_with_every_company_at_once():
+    companies = [f"C{i}" for i in range(70)]
+    selected, _ = plan_companies(companies, {}, budget=1800, workers=None, now=NOW)
+    assert len(selected) == 70
+    stats = {"Big": _stats(30, 2, duration=4000), "Huge": _stats(30, 1, duration=5000), "Small": _stats(30, 0.5)}
+    selected, skipped = plan_companies(["Big", "Huge", "Small"], stats, budget=1800, workers=None, now=NOW)
+    # the first due company always runs, after that the ones that can't finish within the budget are left out
+    assert selected == ["Big", "Small"] and skipped == ["Huge"]
+
+
+def test_shards_split_every_company_once():
+    companies = [f"Company {i}" for i in range(100)]
+    shards = [[company for company in companies if shard_of(company, 4) == i] for i in range(4)]
+    assert sorted(sum(shards, [])) == sorted(companies)
+    assert all(shards)
+    assert parse_shard("1/4") == (1, 4)
+
+
+def test_timed_out_company_is_joined_before_shutdown():
+    release = threading.Event()
+    tasks = {"Stuck": ("https://stuck.wd1.myworkdayjobs.com/External", release.wait)}
+    results = list(run_companies(tasks, timeout=0.1))
+    assert [result["status"] for result in results] == ["timeout"]
+    # still running once the grace period is up
+    assert join_abandoned(0.1) == 1
+    release.set()
+
+    tasks = {"Slow": ("https://slow.wd1.myworkdayjobs.com/External", lambda: time.sleep(1.5))}
+    list(run_companies(tasks, timeout=0.1))
+    assert join_abandoned(5) == 0
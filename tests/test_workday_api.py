@@ -0,0 +1,216 @@
+import pytest
+import urllib3
+
+from company_scrapers.workday_api import (
+    Listing, normalize_link, parse_workday_url, resolve_locations_api, scrape_workday_api,
+)
+from job_store import JobStore
+
+
+def test_parse_workday_url():
+    site = parse_workday_url("https://intel.wd1.myworkdayjobs.com/External")
+    assert site["tenant"] == "intel"
+    assert site["site"] == "External"
+    assert site["api"] == "https://intel.wd1.myworkdayjobs.com/wday/cxs/intel/External"
+    assert site["page_url"] == "https://intel.wd1.myworkdayjobs.com/External"
+
+
+def test_parse_workday_url_trailing_slash():
+    assert parse_workday_url("https://intel.wd1.myworkdayjobs.com/External/") == \
+        parse_workday_url("https://intel.wd1.myworkdayjobs.com/External")
+
+
+def test_parse_workday_url_locale():
+    site = parse_workday_url("https://draftkings.wd1.myworkdayjobs.com/en-US/DraftKings/jobs")
+    assert site["tenant"] == "draftkings"
+    assert site["site"] == "DraftKings"
+    assert site["api"] == "https://draftkings.wd1.myworkdayjobs.com/wday/cxs/draftkings/DraftKings"
+    # postings are relative to the career site page, locale included
+    assert site["page_url"] == "https://draftkings.wd1.myworkdayjobs.com/en-US/DraftKings"
+
+
+def test_parse_workday_url_myworkdaysite():
+    site = parse_workday_url("https://wd1.myworkdaysite.com/en-US/recruiting/snapchat/snap")
+    assert site["tenant"] == "snapchat"
+    assert site["site"] == "snap"
+    assert site["api"] == "https://wd1.myworkdaysite.com/wday/cxs/snapchat/snap"
+    assert site["page_url"] == "https://wd1.myworkdaysite.com/en-US/recruiting/snapchat/snap"
+
+
+SITE = parse_workday_url("https://acme.wd1.myworkdayjobs.com/External")
+
+
+def _page(start, count, total, days=0):
+    postings = [
+        {"title": f"Job {i}", "externalPath": f"/job/R{i}", "locationsText": "Remote",
+         "postedOn": "Posted Today" if days == 0 else f"Posted {days} Days Ago", "bulletFields": [f"R{i}"]}
+        for i in range(start, start + count)
+    ]
+    return {"total": total if start == 0 else 0, "jobPostings": postings}
+
+
+def _link(i):
+    return f"{SITE['page_url']}/job/R{i}"
+
+
+def test_listing_reads_every_page():
+    listing = Listing(SITE)
+    jobs = listing.add(_page(0, 20, 30))
+    assert len(jobs) == 20 and not listing.done
+    # later pages report a total of 0, the first page's is kept
+    jobs = listing.add(_page(20, 10, 30))
+    assert len(jobs) == 10 and listing.done
+
+
+def test_listing_stops_after_known_postings():
+    listing = Listing(SITE, known_links={_link(i) for i in range(5, 40)}, stop_after=10)
+    listing.add(_page(0, 20, 100))
+    assert listing.done
+    assert listing.offset == 20
+
+
+def test_listing_stops_at_high_water():
+    listing = Listing(SITE, stop_after=10, high_water=_link(25))
+    listing.add(_page(0, 20, 100))
+    assert not listing.done
+    listing.add(_page(20, 20, 100))
+    assert listing.done
+
+
+def test_listing_reads_everything_when_not_date_ordered():
+    listing = Listing(SITE, known_links={_link(i) for i in range(100)}, stop_after=10)
+    # older postings followed by newer ones, so the tenant doesn't list by date
+    page = _page(0, 10, 60, days=5)
+    page["jobPostings"] += _page(10, 10, 60)["jobPostings"]
+    listing.add(page)
+    assert not listing.done
+    listing.add(_page(20, 20, 60))
+    assert not listing.done
+    listing.add(_page(40, 20, 60))
+    assert listing.done
+
+
+def test_scrape_against_fixture_server(fixture_server):
+    jobs = scrape_workday_api(f"{fixture_server.url}/External", tenant="fixture")
+    assert len(jobs) == 50
+    assert len({job["link"] for job in jobs}) == 50
+    assert all(job["link"].startswith(f"{fixture_server.url}/External/job/") for job in jobs)
+
+    multiple = [job for job in jobs if "Locations" in job["location"]]
+    resolve_locations_api(jobs)
+    assert all(isinstance(job["location"], list) for job in jobs)
+    assert all("Locations" not in job["location"][0] for job in multiple)
+
+
+def test_normalize_link():
+    link = "https://intel.wd1.myworkdayjobs.com/External/job/Santa-Clara/Software-Engineer_JR0001"
+    assert normalize_link("https://intel.wd1.myworkdayjobs.com/en-US/External/job/Santa-Clara/Software-Engineer_JR0001") == link
+    assert normalize_link(link) == link
+    assert normalize_link("https://wd1.myworkdaysite.com/en-US/recruiting/snapchat/snap/job/R1") == \
+        "https://wd1.myworkdaysite.com/recruiting/snapchat/snap/job/R1"
+
+
+def test_links_match_the_career_site_page(fixture_server):
+    # the listing page links to its postings with the locale in the path, like workday's does
+    page = urllib3.request("GET", f"{fixture_server.url}/External").data.decode()
+    assert f"{fixture_server.url}/en-US/External" in page
+    posting = scrape_workday_api(f"{fixture_server.url}/External", tenant="fixture")[0]
+    href = f"{fixture_server.url}/en-US/External/job/{posting['link'].split('/job/', 1)[1]}"
+    assert normalize_link(href) == posting["link"]
+    # and a career site url with a locale gives the same links as one without
+    localized = scrape_workday_api(f"{fixture_server.url}/en-US/External", tenant="fixture")
+    assert localized[0]["link"] == posting["link"]
+
+
+def test_migrate_normalizes_links(tmp_path):
+    csv_path = tmp_path / "sent_jobs.csv"
+    csv_path.write_text("company,title,link,location,job_id,added_date\n"
+                        "Acme,Engineer,https://acme.wd1.myworkdayjobs.com/en-US/External/job/R1,[],R1,\n")
+    store = JobStore(str(tmp_path / "jobs.db"))
+    store.migrate(str(csv_path), str(tmp_path / "seen_jobs.json"))
+    assert store.sent_titles("Acme", ["https://acme.wd1.myworkdayjobs.com/External/job/R1"]) == \
+        {"https://acme.wd1.myworkdayjobs.com/External/job/R1": "Engineer"}
+    store.close()
+
+
+def test_incremental_scrape_stops_early(fixture_server):
+    url = f"{fixture_server.url}/External"
+    first = scrape_workday_api(url, tenant="fixture")
+    requests = fixture_server.requests
+    again = scrape_workday_api(url, tenant="fixture", known_links={job["link"] for job in first}, stop_after=5)
+    # the first page is enough to see that everything has been seen before
+    assert fixture_server.requests - requests == 1
+    assert len(again) == 20
+
+
+def test_changed_filters_read_every_page(tmp_path):
+    import main
+
+    store = JobStore(str(tmp_path / "jobs.db"))
+    config = {"key_groups": {"software": ["software"]}, "locations": {"remote": ["remote"]}}
+    matcher = main.JobMatcher(config)
+    # never scraped with these filters, so there's nothing to stop at
+    assert main.incremental_state(store, "Acme", matcher, 5) == (None, None, None)
+    links = [_link(i) for i in range(50)]
+    store.mark_seen("Acme", links, links[0], matcher.fingerprint)
+    known_links, stop_after, high_water = main.incremental_state(store, "Acme", matcher, 5)
+    assert known_links == set(links) and stop_after == 5 and high_water == links[0]
+
+    config["key_groups"]["backend"] = ["backend"]
+    assert main.incremental_state(store, "Acme", main.JobMatcher(config), 5) == (None, None, None)
+    store.close()
+
+
+def test_unresolved_locations_are_retried(tmp_path):
+    import main
+    from job_store import MAX_LOCATION_ATTEMPTS
+
+    store = JobStore(str(tmp_path / "jobs.db"))
+    matcher = main.JobMatcher({"key_groups": {"software": ["software"]}, "locations": {"remote": ["remote"]}})
+    job = {"company": "Acme", "title": "Software Engineer", "link": _link(1), "location": "3 Locations",
+           "job_id": "R1", "detail_url": "https://acme.example/detail/R1"}
+    # the lookup failed, so the location is still the listing's
+    job["location"] = [job["location"]]
+    main.save_company(store, "Acme", SITE["page_url"], [job["link"]], [job], matcher)
+    assert store.claim_pending("a") == []
+
+    # next run the posting is past the point an incremental scrape stops at, it's retried anyway
+    candidates = main.add_unresolved(store, "Acme", [])
+    assert [c["link"] for c in candidates] == [job["link"]] and candidates[0]["location"] == "3 Locations"
+    candidates[0]["location"] = ["Remote", "Austin, TX"]
+    main.save_company(store, "Acme", SITE["page_url"], [_link(2)], candidates, matcher)
+    assert [j["link"] for j in store.claim_pending("a")] == [job["link"]]
+    assert main.add_unresolved(store, "Acme", []) == []
+
+    # a lookup that keeps failing is given up on
+    for _ in range(MAX_LOCATION_ATTEMPTS):
+        store.save_unresolved("Acme", [{**job, "link": _link(3)}])
+    assert store.unresolved_jobs("Acme") == []
+    store.close()
+
+
+def test_company_with_no_postings_is_scraped(fixture_server, tmp_path):
+    import asyncio
+
+    import aiohttp
+
+    import main
+    from company_scrapers.workday_async import WorkdayClient
+
+    store = JobStore(str(tmp_path / "jobs.db"))
+    matcher = main.JobMatcher({"key_groups": {"software": ["software"]}, "locations": {"remote": ["remote"]}})
+    fixture_server.fixtures.sites["Empty"] = 0
+    url = f"{fixture_server.url}/Empty"
+    assert main.scrape_company("Empty", url, "api", store, matcher, None) == (0, 0, 0)
+
+    async def scrape_async():
+        async with aiohttp.ClientSession() as session:
+            client = WorkdayClient(session, 10, 10)
+            return await main.scrape_company_async("Empty", url, store, matcher, None, client)
+
+    assert asyncio.run(scrape_async()) == (0, 0, 0)
+
+    # a scrape that found nothing without the site saying it's empty still fails
+    with pytest.raises(RuntimeError, match="no postings found"):
+        main.save_company(store, "Empty", url, [], [], matcher)
+    store.close()
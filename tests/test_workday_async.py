@@ -0,0 +1,25 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from company_scrapers.workday_async import WorkdayClient
+from metrics import current_company, metrics
+
+
+def test_browser_work_leaves_the_default_executor_free():
+    release = threading.Event()
+
+    async def check(browsers):
+        client = WorkdayClient(None, browsers=browsers)
+        # far more fallbacks waiting on a browser than the default executor has threads
+        waiting = [asyncio.ensure_future(client.in_browser(release.wait)) for _ in range(50)]
+        try:
+            assert await asyncio.wait_for(asyncio.to_thread(lambda: "database"), 2) == "database"
+        finally:
+            release.set()
+        await asyncio.gather(*waiting)
+        with metrics.company("Acme"):
+            assert await client.in_browser(current_company) == "Acme"
+
+    with ThreadPoolExecutor(max_workers=2) as browsers:
+        asyncio.run(check(browsers))